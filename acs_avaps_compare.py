@@ -4,10 +4,21 @@ import argparse
 import os
 import glob
 import re
-from netCDF4 import Dataset
-import numpy.ma as ma
-from datetime import datetime, timedelta
-import math
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import catalog
+import clock_offset
+import compressed_io
+import flight_archive
+import job_scheduler
+import profiling
+import resample
+# NumPy and the modules built on it (sounding, avaps_dfile) are imported by the functions that
+# read and compare data, so --help and argument errors don't pay for them
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
 
 def extract_launch_time(filename):
     # Matches pattern like AR2025-20250223N1-01-20250223T203707-5.nc
@@ -41,11 +52,34 @@ def find_d_file(directory, launch_time):
     return matches[0] if matches else None
 
 
-def compare_data(netcdf_file, d_file, launch_time):
-    # Placeholder for comparison logic between NetCDF and D files
-    #print(f"Comparing {netcdf_file} with {d_file}")
-    # open .nc file
-    dataset = Dataset(netcdf_file, 'r')
+def index_d_files(paths):
+    # Map (directory, "DYYYYMMDD_HHMMSS") -> path for an already listed set of files,
+    # so find_d_file lookups don't need a glob per NetCDF file
+    index = {}
+    for path in paths:
+        match = re.match(r'(D\d{8}_\d{6})\.', os.path.basename(path))
+        if match:
+            index.setdefault((os.path.dirname(path), match.group(1)), path)
+    return index
+
+
+def lookup_d_file(d_index, directory, launch_time):
+    # Same search order as find_d_file, against an index from index_d_files
+    d_file = d_index.get((directory, f"D{launch_time}"))
+    if d_file is None:
+        d_file = d_index.get((directory, f"D{adjust_launch_time(launch_time)}"))
+    return d_file
+
+
+def read_acs_sounding(netcdf_file, memory=None):
+    # netCDF4 is imported on first use, so runs that never open a .nc file don't pay for it
+    from netCDF4 import Dataset
+    import numpy as np
+    import numpy.ma as ma
+    import sounding
+
+    # open .nc file (from `memory` when its bytes are already loaded, e.g. from an archive)
+    dataset = Dataset(netcdf_file, 'r', memory=memory)
 
     #gpsutctime: milliseconds since 1970-01-01 23:40:14 +0000 UTC
     #sampletime: milliseconds since 2025-02-20 23:39:35.207027 +0000 UTC
@@ -62,331 +96,224 @@ def compare_data(netcdf_file, d_file, launch_time):
     #for att in dataset.ncattrs():
     #    print(att+': '+str(dataset.getncattr(att)))
 
-    acs_sounding={}
-    #loop through every time value
-    for i in range(dataset.groups['Profile'].variables['GpsUtcTime'].shape[0]):
-        #dont add if GpsUtcTime is not available
-        if dataset.groups['Profile'].variables['GpsUtcTime'][i] is not ma.masked:
-            sample={}
-            millisec_delta=int(dataset.groups['Profile'].variables['GpsUtcTime'][i])
-            timetag=gpsutctime_start+timedelta(milliseconds=millisec_delta)
-            timetag_str=timetag.strftime("%Y-%m-%dT%H:%M:%S.%f")[0:-4]+"Z"
-            
-            for v in dataset.groups['Profile'].variables:
-                if dataset.groups['Profile'].variables[v][i] is not ma.masked:
-                    sample[v]=float(dataset.groups['Profile'].variables[v][i])
-                else:
-                    sample[v]=None
-            acs_sounding[timetag_str]=sample
-    
-
-    file_name = d_file
-    avaps_sounding={}
-    with open(file_name, 'r') as file:
-        for line in file:
-            #not a data line
-            if line.startswith('AVAPS-T'):
-                # Not an end-of-drop parameter line
-                if ':' in line:
-                    label, value = line.split(":", 1)
-                    label = label.strip()
-                    value = value.strip()
-
-                    if 'Launch Time' in label:
-                        # Convert "YYYY-MM-DD, HH:MM:SS" to "YYYY-MM-DDTHH:MM:SSZ"
-                        avaps_launchdetect = value.replace(", ", "T") + "Z"
-                        #print(f"Launch Time: {avaps_launchdetect} ")
-
-                    elif 'Sonde ID' in label:
-                        try:
-                            # AVAPS Sonde ID might look like "240324593, Model: LMS6"
-                            avaps_sonde_id = int(value.split(",")[0])
-                            #print(f"Sonde ID: {avaps_sonde_id} ")
-                        except ValueError:
-                            print(f"Warning: Could not parse Sonde ID from line: {line}")
-
-                    elif 'Sonde Baseline Errors' in label:
-                        try:
-                            pressure_str = value.split(",")[0].strip()  # e.g., "-0.7 mb"
-                            avaps_press_offset = float(pressure_str.replace("mb", "").strip())
-                            #print(f"Pressure Offset: {avaps_press_offset}")
-                        except ValueError:
-                            print(f"Warning: Could not parse Pressure Offset from line: {line}")
-
-
-
-            #data line
-            elif line.startswith('AVAPS-D'):
-                sample={}
-                vals=line.split()
-                
-                #vals[0] is AVAPS-D01
-                #vals[1] is Pxx LAU Axx
-                #skip over the A00 or LAU lines
-                if vals[1][0] not in ["S", "P"]:
-                    continue
-
-                
-                #vals[2] is Sonde ID
-                sample["ID"]=int(vals[2])
-                
-                #vals[3] is YYMMDD
-                #vals[4] is HHMMSS.SS
-                utc="20"+vals[3][0:2]+"-"+vals[3][2:4]+"-"+vals[3][4:6]+"T"+vals[4][0:2]+":"+vals[4][2:4]+":"+vals[4][4:9]+"Z"
-
-                #vals[5] is Pressure
-                if vals[5] == "9999.00":
-                    sample["Pressure"] = None
-                else:
-                    sample["Pressure"] = float(vals[5])
+    profile=dataset.groups['Profile']
+    gpsutctime=profile.variables['GpsUtcTime'][:]
+    #dont add samples where GpsUtcTime is not available
+    valid=~ma.getmaskarray(gpsutctime)
+    n=len(gpsutctime)
+
+    #timetag = start + whole milliseconds, truncated to hundredths of a second as in the CSV timetags
+    start_us=(gpsutctime_start - EPOCH) // timedelta(microseconds=1)
+    millisec_delta=np.trunc(ma.getdata(gpsutctime)[valid]).astype(np.int64)
+    times=(start_us + millisec_delta*1000) // 10000 * 10
+
+    columns={}
+    for v in profile.variables:
+        var=profile.variables[v]
+        if var.ndim != 1 or var.shape[0] != n:
+            continue
+        values=var[:]
+        # keep float32 data as float32; everything else becomes float64
+        dtype=np.float32 if values.dtype == np.float32 else np.float64
+        columns[v]=ma.filled(ma.asarray(values, dtype=dtype), np.nan)[valid]
+    attributes=dataset.__dict__
+    pressure_offset=attributes.get('DropPressureAddition')
+    acs_sounding=sounding.from_samples(times, columns, source=netcdf_file, sonde_id=attributes.get('SerialNumber'),
+                                       pressure_offset=None if pressure_offset is None else float(pressure_offset))
+    dataset.close()
+    return acs_sounding
+
+
+def read_avaps_sounding(d_file, launch_time=None, data=None):
+    import avaps_dfile
+
+    return select_avaps_drop(avaps_dfile.read_drops(d_file, data), d_file, launch_time)
+
+
+def select_avaps_drop(drops, d_file, launch_time=None):
+    # D files may hold several concatenated drops; pick the one launched at launch_time
+    # ("YYYYMMDD_HHMMSS", one second of slack as in find_d_file)
+    import numpy as np
+    import avaps_dfile
+    import sounding
+
+    if len(drops) == 1:
+        return drops[0]
+    if not drops:
+        return sounding.from_samples([], {name: [] for name, _, _ in avaps_dfile.AVAPS_D_FIELDS}, source=d_file)
+
+    if launch_time is not None:
+        wanted = set()
+        for candidate in (launch_time, adjust_launch_time(launch_time)):
+            if candidate:
+                wanted.add(datetime.strptime(candidate, "%Y%m%d_%H%M%S").strftime("%Y-%m-%dT%H:%M:%SZ"))
+        matches = [drop for drop in drops if drop.launch_time in wanted]
+        if matches:
+            return matches[0]
+    print(f"Warning: {d_file} holds {len(drops)} drops and none matches launch time {launch_time}; using all of them.")
+    return sounding.from_samples(np.concatenate([drop.times for drop in drops]),
+                                 {name: np.concatenate([drop[name] for drop in drops])
+                                  for name, _, _ in avaps_dfile.AVAPS_D_FIELDS},
+                                 source=d_file)
+
+
+CSV_HEADER = (
+    'GPS UTC Timetag,'
+    'AVAPS air_press,ACS Pressure,ACS Rounded Pressure,AVAPS - ACS Pressure,'
+    'AVAPS air_temp,ACS Temperature,ACS Rounded Temperature,AVAPS - ACS Temperature,'
+    'AVAPS rel_hum,ACS Humidity,ACS Rounded Humidity,AVAPS - ACS Humidity,'
+    'AVAPS wind_dir,ACS WindDirection,ACS Rounded WindDirection,AVAPS - ACS WindDirection,'
+    'AVAPS wind_spd,ACS WindSpeed,ACS Rounded WindSpeed,AVAPS - ACS WindSpeed,'
+    'AVAPS u_comp,ACS U_Component,ACS Rounded U,AVAPS - ACS U,'
+    'AVAPS v_comp,ACS V_Component,ACS Rounded V,AVAPS - ACS V'
+    #'AVAPS vert_vel,ACS GpsDzDt,ACS Rounded GpsDzDt,AVAPS - ACS GpsDzDt,'
+    #'AVAPS vert_vel,ACS PDzDt,ACS Rounded PDzDt,AVAPS - ACS PDzDt,'
+    #'AVAPS gps_long,ACS Longitude,ACS Rounded Longitude,AVAPS - ACS Longitude,'
+    #'AVAPS gps_lat,ACS Latitude,ACS Rounded Latitude,AVAPS - ACS Latitude,'
+    #'AVAPS geop_alt,ACS GeoAltitude,ACS Rounded GeoAltitude,AVAPS - ACS GeoAltitude,'
+    #'AVAPS gps_wnd_sat,ACS GpsSats,ACS Rounded GpsSats,AVAPS - ACS GpsSats,'
+    #'AVAPS rh1,ACS SensorHumidity,ACS Rounded SensorHumidity,AVAPS - ACS SensorHumidity,'
+    #'AVAPS wind_err,ACS GpsSpeedAcc,ACS Rounded GpsSpeedAcc,AVAPS - ACS GpsSpeedAcc,'
+    #'AVAPS gps_alt,ACS GpsAltitude,ACS Rounded GpsAltitude,AVAPS - ACS GpsAltitude,'
+)
+CSV_COLUMNS = CSV_HEADER.split(',')
+
+# (AVAPS variable, ACS variable, # digits the ACS value is rounded to, as AVAPS reports it)
+COMPARED_VARIABLES = [
+    ('Pressure',      'Pressure',       2),
+    ('Temperature',   'Temperature',    2),
+    ('Humidity',      'Humidity',       2),
+    ('WindDirection', 'WindDirection',  2),
+    ('WindSpeed',     'WindSpeed',      2),
+    #('vert_vel',     'GpsDzDt',        2),
+    #('vert_vel',     'PDzDt',          2),
+    #('gps_lon',      'Longitude',      6),
+    #('gps_lat',      'Latitude',       6),
+    #('geop_alt',     'GeoAltitude',    2),
+    #('gps_wnd_sat',  'GpsSats',        0),
+    #('rh1',          'SensorHumidity', 2),
+    #('wind_err',     'GpsSpeedAcc',    2),
+    #('gps_alt',      'GpsAltitude',    2),
+]
+
+
+def build_comparison_table(acs_sounding, avaps_sounding, interpolated=False):
+    # One row per timetag in either sounding, columns as in CSV_COLUMNS[1:]:
+    # (AVAPS, ACS, ACS rounded, AVAPS - ACS) for each variable, then the u and v wind components.
+    # interpolated: the soundings were resampled, so ACS is rounded to nearest rather than truncated
+    import numpy as np
+    import sounding
+
+    times = np.union1d(acs_sounding.times, avaps_sounding.times)
+    acs = acs_sounding.align(times)
+    avaps = avaps_sounding.align(times)
+    missing = np.full(len(times), np.nan)
+
+    pairs = [(avaps.get(avaps_key, missing), acs.get(acs_key, missing), dig)
+             for avaps_key, acs_key, dig in COMPARED_VARIABLES]
 
-                #vals[6] is Temperature
-                if vals[6] == "99.00":
-                    sample["Temperature"] = None
-                else:
-                    sample["Temperature"] = float(vals[6])
+    # Wind component comparison
+    avaps_u, avaps_v = sounding.wind_to_uv(avaps.get('WindSpeed', missing), avaps.get('WindDirection', missing))
+    acs_u, acs_v = sounding.wind_to_uv(acs.get('WindSpeed', missing), acs.get('WindDirection', missing))
+    pairs.append((avaps_u, acs_u, 2))
+    pairs.append((avaps_v, acs_v, 2))
 
-                #vals[7] is Humidity
-                if vals[7] == "999.00":
-                    sample["Humidity"] = None
-                else:
-                    sample["Humidity"] = float(vals[7])
+    columns = {}
+    names = CSV_COLUMNS[1:]
+    for k, (avaps_val, acs_val, dig) in enumerate(pairs):
+        #round the ACS value to the same # digits as AVAPS; NaN propagates where either side is missing
+        acs_val_rnd = sounding.round_digits(acs_val, dig, truncate=not interpolated)
+        for name, values in zip(names[4 * k:4 * k + 4], (avaps_val, acs_val, acs_val_rnd, avaps_val - acs_val_rnd)):
+            columns[name] = values
+    return sounding.Sounding(times, columns)
 
-                #vals[8] is Wind Direction
-                if vals[8] == "999.00":
-                    sample["WindDirection"] = None
-                else:
-                    sample["WindDirection"] = float(vals[8])
 
-                #vals[9] is Wind Speed
-                if vals[9] == "999.00":
-                    sample["WindSpeed"] = None
-                else:
-                    sample["WindSpeed"] = float(vals[9])
+def empty_comparison_table():
+    import numpy as np
+    import sounding
 
-                #vals[10] is Vertical Velocity (assume GPS?)
-                if vals[10] == "99.00":
-                    sample["GpsDzDt"] = None
-                else:
-                    sample["GpsDzDt"] = float(vals[10])
+    return sounding.Sounding(np.empty(0, dtype=np.int64), {name: np.empty(0) for name in CSV_COLUMNS[1:]})
 
-                #vals[11] is Longitude
-                if vals[11] == "999.000000":
-                    sample["Longitude"] = None
-                else:
-                    sample["Longitude"] = float(vals[11])
 
-                #vals[12] is Latitude
-                if vals[12] == "99.000000":
-                    sample["Latitude"] = None
-                else:
-                    sample["Latitude"] = float(vals[12])
+def write_comparison_csv(csv_path, table):
+    with compressed_io.open_text(csv_path, "w") as f:
+        write_comparison_rows(f, table)
 
-                #vals[13] is GeoPotential Altitude
-                if vals[13] == "99999.00":
-                    sample["GeoAltitude"] = None
-                else:
-                    sample["GeoAltitude"] = float(vals[13])
 
-                #vals[14] is GPS Wind Sat
-                sample["GpsSats"] = int(vals[14])
+def write_comparison_rows(f, table):
+    columns = [table.columns[name].tolist() for name in CSV_COLUMNS[1:]]
+    f.write(CSV_HEADER + '\n')
+    for tt, *row in zip(table.timetags(), *columns):
+        # NaN (missing) values are written as empty fields
+        f.write(tt + ',' + ','.join('' if value != value else str(value) for value in row) + '\n')
 
-                #vals[15] is RH1 
-                #(unsure how this differes from Humidity Above
-                if vals[15] == "999.00":
-                    sample["RH1"] = None
-                else:
-                    sample["RH1"] = float(vals[15])
 
-                #vals[16] is RH2
-                #appears to always be 999.00
-                if vals[16] == "999.00":
-                    sample["RH2"] = None
-                else:
-                    sample["RH2"] = float(vals[16])
+def read_inputs(netcdf_file, d_file, launch_time):
+    with profiling.stage("read_netcdf", file=launch_time) as st:
+        acs_sounding = read_acs_sounding(netcdf_file)
+        st.bytes_read += os.path.getsize(netcdf_file)
+        st.samples += len(acs_sounding)
 
-                #vals[16] is GPS Snd Sat
-                sample["GpsSndSat"] = int(vals[17])
-                
-                if vals[18] == "99.00":
-                    sample["wind_err"] = None
-                else:
-                    sample["wind_err"] = float(vals[18])
+    with profiling.stage("read_dfile", file=launch_time) as st:
+        avaps_sounding = read_avaps_sounding(d_file, launch_time)
+        st.bytes_read += os.path.getsize(d_file)
+        st.samples += len(avaps_sounding)
 
-                if vals[19] == "99999.00":
-                    sample["gps_alt"] = None
-                else:
-                    sample["gps_alt"] = float(vals[19])
-                    
-                avaps_sounding[utc]=sample
-
-    def round_digits( num, dec_digits ):
-        val=num * pow(10,dec_digits)
-        ival=int(val)
-        return float(ival / pow(10,dec_digits))
-
-    def write_val(f, value):
-        f.write(',')
-        if value is not None:
-            f.write(str(value))
-
-    def append_output(f, tt, avaps_key, acs_key, dig):
-        #write the AVAPS value
-        if tt in avaps_sounding and avaps_key in avaps_sounding[tt]:
-            avaps_val=avaps_sounding[tt][avaps_key]
-        else:
-            avaps_val=None
-        
-        #write the ACS equivalent
-        if tt in acs_sounding and acs_key in acs_sounding[tt]:
-            acs_val=acs_sounding[tt][acs_key]
-        else:
-            acs_val=None
-
-        #round the ACS value to the same # digits as AVAPS
-        if acs_val is None:
-            acs_val_rnd=None
-        else:
-            acs_val_rnd=round_digits(acs_sounding[tt][acs_key],dig)
-        
-        write_val(f, avaps_val)
-        write_val(f, acs_val)
-        write_val(f, acs_val_rnd)
-        if ( acs_val is not None ) and (avaps_val is not None):
-            write_val(f, avaps_val - acs_val_rnd)
-        else:
-            write_val(f, None)
+    return acs_sounding, avaps_sounding
 
-    # Wind component comparison
-    def append_wind_component(f, tt, component):
-        # component should be 'u' or 'v'
-        avaps_spd = avaps_sounding[tt].get("WindSpeed") if tt in avaps_sounding else None
-        avaps_dir = avaps_sounding[tt].get("WindDirection") if tt in avaps_sounding else None
-        acs_spd   = acs_sounding[tt].get("WindSpeed")   if tt in acs_sounding else None
-        acs_dir   = acs_sounding[tt].get("WindDirection")   if tt in acs_sounding else None
-
-        avaps_u, avaps_v = wind_to_uv(avaps_spd, avaps_dir)
-        acs_u, acs_v     = wind_to_uv(acs_spd, acs_dir)
-
-        if component == 'u':
-            avaps_val = avaps_u
-            acs_val   = acs_u
-        else:
-            avaps_val = avaps_v
-            acs_val   = acs_v
 
-        if acs_val is not None:
-            acs_val_rnd = round_digits(acs_val, 2)
-        else:
-            acs_val_rnd = None
-
-        write_val(f, avaps_val)
-        write_val(f, acs_val)
-        write_val(f, acs_val_rnd)
-        if ( avaps_val is not None ) and (acs_val_rnd is not None):
-            write_val(f, avaps_val - acs_val_rnd)
-        else:
-            write_val(f, None)
-
-
-
-    # Define subdirectory
-    output_dir = "processed"
-
-    # Make sure it exists
-    os.makedirs(output_dir, exist_ok=True)
-
-    # Use it in your file path
-    csv_path = os.path.join(output_dir, f"{launch_time}.csv")
-
-    # Open the files
-    f = open(csv_path, "w")
-
-    f.write('GPS UTC Timetag,')
-    f.write('AVAPS air_press,ACS Pressure,ACS Rounded Pressure,AVAPS - ACS Pressure,'      )
-    f.write('AVAPS air_temp,ACS Temperature,ACS Rounded Temperature,AVAPS - ACS Temperature,'   )
-    f.write('AVAPS rel_hum,ACS Humidity,ACS Rounded Humidity,AVAPS - ACS Humidity,'      )
-    f.write('AVAPS wind_dir,ACS WindDirection,ACS Rounded WindDirection,AVAPS - ACS WindDirection,' )
-    f.write('AVAPS wind_spd,ACS WindSpeed,ACS Rounded WindSpeed,AVAPS - ACS WindSpeed,'     )
-    f.write('AVAPS u_comp,ACS U_Component,ACS Rounded U,AVAPS - ACS U,')
-    f.write('AVAPS v_comp,ACS V_Component,ACS Rounded V,AVAPS - ACS V,')
-    #f.write('AVAPS vert_vel,ACS GpsDzDt,ACS Rounded GpsDzDt,AVAPS - ACS GpsDzDt,'       )
-    #f.write('AVAPS vert_vel,ACS PDzDt,ACS Rounded PDzDt,AVAPS - ACS PDzDt,'         )
-    #f.write('AVAPS gps_long,ACS Longitude,ACS Rounded Longitude,AVAPS - ACS Longitude,'     )
-    #f.write('AVAPS gps_lat,ACS Latitude,ACS Rounded Latitude,AVAPS - ACS Latitude,'      )
-    #f.write('AVAPS geop_alt,ACS GeoAltitude,ACS Rounded GeoAltitude,AVAPS - ACS GeoAltitude,'   )
-    #f.write('AVAPS gps_wnd_sat,ACS GpsSats,ACS Rounded GpsSats,AVAPS - ACS GpsSats,'       )
-    #f.write('AVAPS rh1,ACS SensorHumidity,ACS Rounded SensorHumidity,AVAPS - ACS SensorHumidity,')
-    #f.write('AVAPS wind_err,ACS GpsSpeedAcc,ACS Rounded GpsSpeedAcc,AVAPS - ACS GpsSpeedAcc,'   )
-    #f.write('AVAPS gps_alt,ACS GpsAltitude,ACS Rounded GpsAltitude,AVAPS - ACS GpsAltitude,'   )
-    #f.write('\n')
-
-    #get the first and last timetag of each sounding, 
-    #then get the minimum between the two where they both were recording
-    if not acs_sounding or not avaps_sounding:
+def compare_soundings(acs_sounding, avaps_sounding, launch_time, grid=None, clock=None, offsets=None):
+    # grid: a resample.Grid to compare on a common uniform time grid instead of identical timetags
+    # clock: a clock_offset.OffsetEstimator to report (and, if set to, remove) the ACS vs AVAPS clock offset
+    # offsets: dict collecting launch_time -> clock_offset.ClockOffset (None if not determined)
+    if not len(acs_sounding) or not len(avaps_sounding):
         print(f"Warning: Missing data for {launch_time}.")
         print(f"  ACS points: {len(acs_sounding)}")
         print(f"  AVAPS points: {len(avaps_sounding)}")
-        return
+        return empty_comparison_table()
+
+    interpolated = grid is not None
+    if clock is not None:
+        with profiling.stage("clock_offset", file=launch_time) as st:
+            offset = clock.estimate(acs_sounding, avaps_sounding)
+            st.samples += len(acs_sounding) + len(avaps_sounding)
+        applied = clock.apply and offset is not None
+        print(clock_offset.format_offset(launch_time, offset, applied))
+        if offsets is not None:
+            offsets[launch_time] = offset
+        if applied:
+            acs_sounding = clock_offset.apply_offset(acs_sounding, avaps_sounding, offset, grid)
+            interpolated = interpolated or offset.offset_ms != 0
+
+    if grid is not None:
+        with profiling.stage("resample", file=launch_time) as st:
+            acs_sounding, avaps_sounding = resample.common_grid(
+                acs_sounding, avaps_sounding, grid, [(avaps_key, acs_key) for avaps_key, acs_key, _ in COMPARED_VARIABLES])
+            st.samples += len(acs_sounding)
+
+    with profiling.stage("align", file=launch_time) as st:
+        table = build_comparison_table(acs_sounding, avaps_sounding, interpolated)
+        st.samples += len(table)
+    return table
+
+
+def write_output(table, launch_time, output_dir="processed", compression=None):
+    # Make sure the output subdirectory exists
+    os.makedirs(output_dir, exist_ok=True)
+    csv_path = compressed_io.with_compression(os.path.join(output_dir, f"{launch_time}.csv"), compression)
+
+    with profiling.stage("write_csv", file=launch_time) as st:
+        write_comparison_csv(csv_path, table)
+        st.samples += len(table)
+    return csv_path
 
-    acs_first_tt=sorted(acs_sounding.keys())[0]
-    acs_last_tt=sorted(acs_sounding.keys())[len(acs_sounding)-1]
-    acs_first_tt=sorted(acs_sounding.keys())[0]
-    acs_last_tt=sorted(acs_sounding.keys())[len(acs_sounding)-1]
-    avaps_first_tt=sorted(avaps_sounding.keys())[0]
-    avaps_last_tt=sorted(avaps_sounding.keys())[len(avaps_sounding)-1]
-    if avaps_first_tt > acs_first_tt:
-        both_first_tt=avaps_first_tt
-    else:
-        both_first_tt=acs_first_tt
-    if avaps_last_tt < acs_last_tt:
-        both_last_tt=avaps_last_tt
-    else:
-        both_last_tt=acs_last_tt    
-
-    #get all timetags from both sounding to get a full list
-    all_tt=list(acs_sounding.keys())
-    for tt in avaps_sounding.keys():
-        if not tt in all_tt:
-            all_tt.append(tt)
-            #print('add: '+tt)
-    all_tt.sort()
-
-    #ff = open(f"{launch_time}.txt", "w")
-    for tt in all_tt:
-        #ff.write(tt+'   ')
-        #if tt in avaps_sounding:
-        #    if 'geop_alt' in avaps_sounding[tt]:
-        #        ff.write('AVAPS {:10s} '.format(str(avaps_sounding[tt]['geop_alt'])))
-        #    else:
-        #        ff.write('AVAPS {:10s} '.format('N/A'))  # or some default/fallback value
-        #else:
-        #    ff.write('                ')
-        #if tt in acs_sounding:
-        #    ff.write('ACS: {:10s}'.format(str(acs_sounding[tt]['GeoAltitude'])))
-        #else:
-        #    ff.write('               ')
-        #ff.write('\n')
-
-        f.write(tt)
-        append_output(f, tt, 'Pressure',    'Pressure',       2)
-        append_output(f, tt, 'Temperature',     'Temperature',    2)
-        append_output(f, tt, 'Humidity',      'Humidity',       2)
-        append_output(f, tt, 'WindDirection',     'WindDirection',  2)
-        append_output(f, tt, 'WindSpeed',     'WindSpeed',      2)
-        append_wind_component(f, tt, 'u')
-        append_wind_component(f, tt, 'v')
-        #append_output(f, 'vert_vel',     'GpsDzDt',        2)
-        #append_output(f, 'vert_vel',     'PDzDt',          2)
-        #append_output(f, 'gps_lon',      'Longitude',      6)
-        #append_output(f, 'gps_lat',      'Latitude',       6)
-        #append_output(f, 'geop_alt',     'GeoAltitude',    2)
-        #append_output(f, 'gps_wnd_sat',  'GpsSats',        0)
-        #append_output(f, 'rh1',          'SensorHumidity', 2)
-        #append_output(f, 'wind_err',     'GpsSpeedAcc',    2)
-        #append_output(f, 'gps_alt',      'GpsAltitude',    2)
-        f.write('\n')
 
+def compare_data(netcdf_file, d_file, launch_time, output_dir="processed", compression=None, grid=None, clock=None,
+                 offsets=None):
+    acs_sounding, avaps_sounding = read_inputs(netcdf_file, d_file, launch_time)
+    table = compare_soundings(acs_sounding, avaps_sounding, launch_time, grid, clock, offsets)
+    write_output(table, launch_time, output_dir, compression)
+    return table
 
 
 def get_sonde_id_from_netcdf(nc_dataset):
@@ -413,13 +340,86 @@ def get_pressure_offset_from_dfile(d_file_path):
                 return float(pressure_str)
     return None
 
-def wind_to_uv(speed, direction_deg):
-    if speed is None or direction_deg is None:
-        return (None, None)
-    direction_rad = math.radians(direction_deg)
-    u = -speed * math.sin(direction_rad)  # East-West component (positive = wind from west)
-    v = -speed * math.cos(direction_rad)  # North-South component (positive = wind from south)
-    return u, v
+def read_drop_metadata(netcdf_file, d_file):
+    # Sonde IDs and pressure offsets from both systems, for the catalog; None where an attribute is absent
+    from netCDF4 import Dataset
+
+    with Dataset(netcdf_file, 'r') as dataset:
+        attributes = dataset.__dict__
+    acs_pressure_offset = attributes.get('DropPressureAddition')
+    return {
+        'acs_sonde_id': attributes.get('SerialNumber'),
+        'acs_pressure_offset': None if acs_pressure_offset is None else float(acs_pressure_offset),
+        'avaps_sonde_id': get_sonde_id_from_dfile(d_file) if d_file else None,
+        'avaps_pressure_offset': get_pressure_offset_from_dfile(d_file) if d_file else None,
+    }
+
+
+def sounding_metadata(acs_sounding, avaps_sounding):
+    # Same catalog fields as read_drop_metadata, from soundings already read
+    return {
+        'acs_sonde_id': acs_sounding.sonde_id,
+        'acs_pressure_offset': acs_sounding.pressure_offset,
+        'avaps_sonde_id': avaps_sounding.sonde_id if avaps_sounding is not None else None,
+        'avaps_pressure_offset': avaps_sounding.pressure_offset if avaps_sounding is not None else None,
+    }
+
+
+def drop_metadata(netcdf_file, d_file, launch_time):
+    try:
+        return read_drop_metadata(netcdf_file, d_file)
+    except (AttributeError, KeyError, OSError, ValueError) as e:
+        print(f"Warning: Could not read catalog metadata for {launch_time}: {e}")
+        return {}
+
+
+def record_drop(catalog, netcdf_file, d_file, launch_time):
+    catalog.record_drop(launch_time, netcdf_file, d_file, **drop_metadata(netcdf_file, d_file, launch_time))
+
+
+def save_offsets(offsets, output_dir, catalog=None, compression=None, clock=None):
+    # clock_offsets.csv goes next to the per-drop CSVs rather than among them, where csv_process
+    # would take it for a drop
+    clock_offset.save_offsets(offsets, os.path.dirname(output_dir) or ".", catalog, compression,
+                              clock is not None and clock.apply)
+
+
+def read_drop(netcdf_file, with_metadata=False):
+    # Read stage of compare_directory: locate the D file and load both soundings
+    launch_time = extract_launch_time(os.path.basename(netcdf_file))
+    with profiling.stage("find_d_file", file=launch_time):
+        d_file = find_d_file(os.path.dirname(netcdf_file), launch_time)
+    soundings = read_inputs(netcdf_file, d_file, launch_time) if d_file else None
+    metadata = None
+    if with_metadata:
+        # from the soundings just read; only a NetCDF file without a D file is opened for it
+        metadata = sounding_metadata(*soundings) if soundings else drop_metadata(netcdf_file, d_file, launch_time)
+    return launch_time, d_file, soundings, metadata
+
+
+def prefetched(func, items, depth, *args):
+    # Yields func(item, *args) for each item, in order, keeping up to `depth` calls queued ahead
+    # of the consumer. A single reader thread is used because netCDF4/HDF5 calls must not run
+    # concurrently; file reads overlap with the consumer's compute instead.
+    if depth <= 0:
+        for item in items:
+            yield func(item, *args)
+        return
+
+    items = iter(items)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=1) as reader:
+        try:
+            for item in itertools.islice(items, depth):
+                pending.append(reader.submit(func, item, *args))
+            while pending:
+                future = pending.popleft()
+                for item in itertools.islice(items, 1):
+                    pending.append(reader.submit(func, item, *args))
+                yield future.result()
+        finally:
+            for future in pending:
+                future.cancel()
 
 
 
@@ -429,29 +429,168 @@ def wind_to_uv(speed, direction_deg):
 
 def main():
     parser = argparse.ArgumentParser(description="Compare ACS and AVAPS dropsonde data in a given directory.")
-    parser.add_argument("directory", type=str, help="Path to the directory containing data files")
+    parser.add_argument("directory", type=str,
+                        help="Path to the directory containing data files, or a .tar.gz/.zip flight archive of them")
+    compressed_io.add_arguments(parser)
+    parser.add_argument("--prefetch", type=int, default=2, metavar="K",
+                        help="Read up to K drops ahead while comparing and writing (0 = no pipelining, default: 2)")
+    resample.add_arguments(parser)
+    clock_offset.add_arguments(parser)
+    job_scheduler.add_arguments(parser)
+    catalog.add_arguments(parser)
+    profiling.add_arguments(parser)
     args = parser.parse_args()
+    grid = resample.grid_from_args(args)
+    clock = clock_offset.from_args(args)
+    scheduler = job_scheduler.from_args(args, "acs_avaps_compare")
 
     directory = args.directory
-    if not os.path.isdir(directory):
-        print(f"Error: {directory} is not a valid directory.")
+    archive = flight_archive.is_archive(directory)
+    if not archive and not os.path.isdir(directory):
+        print(f"Error: {directory} is not a valid directory or flight archive.")
         return
 
+    profiling.start_from_args(args, "acs_avaps_compare")
+    with catalog.open_from_args(args) as cat:
+        if archive:
+            compare_archive(directory, cat, args.compress, grid, clock)
+        else:
+            compare_directory(directory, cat, args.compress, args.prefetch, grid, clock, scheduler)
+    profiling.finish_from_args(args)
+
+
+def compare_directory(directory, catalog=None, compression=None, prefetch=2, grid=None, clock=None, scheduler=None,
+                      output_dir="processed"):
     # Find all NetCDF files in the directory
-    netcdf_files = glob.glob(os.path.join(directory, "**", "*.nc"), recursive=True)
+    with profiling.stage("scan_directory") as st:
+        netcdf_files = glob.glob(os.path.join(directory, "**", "*.nc"), recursive=True)
+        st.samples += len(netcdf_files)
     total_files = len(netcdf_files)
     print(f"Found {len(netcdf_files)} NetCDF files:")
-    for i, file in enumerate(netcdf_files, start=1):
-        print(f"Processing file {i} of {total_files}: {os.path.basename(file)}")
-        launch_time = extract_launch_time(os.path.basename(file))
-        file_dir = os.path.dirname(file)
-        d_file = find_d_file(file_dir, launch_time)
-        print(f"{file} -> Launch time: {launch_time} -> D file: {d_file if d_file else 'NOT FOUND'}")
+    if scheduler is not None:
+        return compare_scheduled(directory, netcdf_files, scheduler, catalog, compression, grid, clock, output_dir)
 
-        if d_file:
-            compare_data(file, d_file, launch_time)
+    offsets = {}
+    # read (background thread, `prefetch` drops ahead) -> compare (this thread) -> write (background thread)
+    writer = ThreadPoolExecutor(max_workers=1) if prefetch > 0 else None
+    writes = deque()
+    try:
+        drops = prefetched(read_drop, netcdf_files, prefetch, catalog is not None)
+        for i, (file, (launch_time, d_file, soundings, metadata)) in enumerate(zip(netcdf_files, drops), start=1):
+            print(f"Processing file {i} of {total_files}: {os.path.basename(file)}")
+            print(f"{file} -> Launch time: {launch_time} -> D file: {d_file if d_file else 'NOT FOUND'}")
+
+            if d_file:
+                table = compare_soundings(*soundings, launch_time, grid, clock, offsets)
+                if writer is None:
+                    write_output(table, launch_time, output_dir, compression)
+                else:
+                    writes.append(writer.submit(write_output, table, launch_time, output_dir, compression))
+                    # bound the number of finished tables waiting to be written
+                    while len(writes) > prefetch:
+                        writes.popleft().result()
+            if catalog is not None:
+                catalog.record_drop(launch_time, file, d_file, **metadata)
+        while writes:
+            writes.popleft().result()
+    finally:
+        if writer is not None:
+            writer.shutdown()
+    save_offsets(offsets, output_dir, catalog, compression, clock)
+
+def compare_drop_job(netcdf_file, compression=None, grid=None, clock=None, with_metadata=False,
+                     output_dir="processed"):
+    # One drop of compare_directory (read, compare, write), run in a scheduler worker process
+    launch_time, d_file, soundings, metadata = read_drop(netcdf_file, with_metadata)
+    print(f"{netcdf_file} -> Launch time: {launch_time} -> D file: {d_file if d_file else 'NOT FOUND'}")
+    offsets = {}
+    if d_file:
+        write_output(compare_soundings(*soundings, launch_time, grid, clock, offsets), launch_time, output_dir,
+                     compression)
+    return launch_time, d_file, metadata, offsets
+
+
+def compare_scheduled(directory, netcdf_files, scheduler, catalog=None, compression=None, grid=None, clock=None,
+                      output_dir="processed"):
+    # compare_directory over worker processes, largest drops (NetCDF + D file bytes and samples) first
+    with profiling.stage("estimate_jobs") as st:
+        d_index = index_d_files(glob.glob(os.path.join(directory, "**", "D*"), recursive=True))
+        jobs = []
+        for netcdf_file in netcdf_files:
+            d_file = lookup_d_file(d_index, os.path.dirname(netcdf_file),
+                                   extract_launch_time(os.path.basename(netcdf_file)))
+            jobs.append((netcdf_file, (netcdf_file, compression, grid, clock, catalog is not None, output_dir),
+                         job_scheduler.file_units([netcdf_file, d_file], netcdf_file)))
+        st.samples += len(jobs)
+    offsets = {}
+    for i, (netcdf_file, (launch_time, d_file, metadata, drop_offsets)) in enumerate(
+            scheduler.run(compare_drop_job, jobs), start=1):
+        print(f"Finished file {i} of {len(jobs)}: {os.path.basename(netcdf_file)}")
+        offsets.update(drop_offsets)
+        if catalog is not None:
+            catalog.record_drop(launch_time, netcdf_file, d_file, **metadata)
+    save_offsets(offsets, output_dir, catalog, compression, clock)
+
+
+def compare_archive(archive, catalog=None, compression=None, grid=None, clock=None, output_dir="processed"):
+    # One sequential pass over a flight archive, nothing extracted to disk: each NetCDF and D file
+    # member is parsed from memory as it arrives, and a drop is compared as soon as both of its
+    # files have been seen. Only parsed soundings still waiting for their partner are kept.
+    import avaps_dfile
+
+    waiting_acs = {}  # (directory, launch time) -> (NetCDF path, Sounding)
+    waiting_d = {}    # (directory, "DYYYYMMDD_HHMMSS") -> (D file path, [Sounding] per drop in the file)
+    offsets = {}
+    count = 0
+
+    def compare_pair(netcdf_file, acs_sounding, d_file, avaps_drops, launch_time):
+        print(f"{netcdf_file} -> Launch time: {launch_time} -> D file: {d_file}")
+        avaps_sounding = select_avaps_drop(avaps_drops, d_file, launch_time)
+        write_output(compare_soundings(acs_sounding, avaps_sounding, launch_time, grid, clock, offsets), launch_time,
+                     output_dir, compression)
+        if catalog is not None:
+            catalog.record_drop(launch_time, netcdf_file, d_file, **sounding_metadata(acs_sounding, avaps_sounding))
+
+    for path, kind, data in flight_archive.iter_members(archive, ("netcdf", "dfile")):
+        directory, name = os.path.split(path)
+        if kind == "netcdf":
+            count += 1
+            print(f"Processing file {count}: {name}")
+            launch_time = extract_launch_time(name)
+            with profiling.stage("read_netcdf", file=launch_time) as st:
+                acs_sounding = read_acs_sounding(path, memory=data)
+                st.bytes_read += len(data)
+                st.samples += len(acs_sounding)
+            # same search order as find_d_file
+            partner = (waiting_d.pop((directory, f"D{launch_time}"), None)
+                       or waiting_d.pop((directory, f"D{adjust_launch_time(launch_time)}"), None))
+            if partner:
+                compare_pair(path, acs_sounding, *partner, launch_time)
+            else:
+                waiting_acs[(directory, launch_time)] = (path, acs_sounding)
+        else:
+            stamp = flight_archive.D_FILE_RE.match(name).group(0)[:-1]
+            with profiling.stage("read_dfile", file=stamp[1:]) as st:
+                avaps_drops = avaps_dfile.read_drops(path, data)
+                st.bytes_read += len(data)
+                st.samples += sum(len(drop) for drop in avaps_drops)
+            # a NetCDF file launched at this time, or one second earlier, may be waiting for it
+            earlier = (datetime.strptime(stamp[1:], "%Y%m%d_%H%M%S") - timedelta(seconds=1)).strftime("%Y%m%d_%H%M%S")
+            for launch_time in (stamp[1:], earlier):
+                waiting = waiting_acs.pop((directory, launch_time), None)
+                if waiting:
+                    compare_pair(*waiting, path, avaps_drops, launch_time)
+                    break
+            else:
+                waiting_d[(directory, stamp)] = (path, avaps_drops)
+
+    for (directory, launch_time), (netcdf_file, acs_sounding) in sorted(waiting_acs.items()):
+        print(f"{netcdf_file} -> Launch time: {launch_time} -> D file: NOT FOUND")
+        if catalog is not None:
+            catalog.record_drop(launch_time, netcdf_file, None, **sounding_metadata(acs_sounding, None))
+    save_offsets(offsets, output_dir, catalog, compression, clock)
+    print(f"Processed {count} NetCDF files from {archive}.")
 
-    # Placeholder for data loading and comparison logic
 
 if __name__ == "__main__":
     main()
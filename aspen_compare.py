@@ -1,10 +1,17 @@
 import os
 import re
+import argparse
+from collections import defaultdict
+import catalog
+import compressed_io
+import flight_archive
+import profiling
 
 def extract_xxaa_block(file_path):
     with open(file_path, 'r') as f:
-        lines = f.readlines()
+        return xxaa_block(f.readlines())
 
+def xxaa_block(lines):
     block = []
     in_xxaa = False
 
@@ -40,8 +47,30 @@ def compare_blocks(block1, block2):
     return diffs
 
 def find_matching_pairs(directory):
-    acs_files = [f for f in os.listdir(directory) if f.startswith("AR2025-") and f.endswith(".WMO")]
-    avaps_files = [f for f in os.listdir(directory) if f.startswith("D") and f.endswith("_P.WMO")]
+    return pair_wmo_files(directory, os.listdir(directory))
+
+def read_archive_blocks(archive):
+    # {member path: XXAA block} for every .WMO member of a flight archive, in one pass
+    blocks = {}
+    for path, _, data in flight_archive.iter_members(archive, ("wmo",)):
+        with profiling.stage("extract_xxaa", file=os.path.basename(path)) as st:
+            blocks[path] = xxaa_block(flight_archive.text_lines(data))
+            st.bytes_read += len(data)
+            st.samples += len(blocks[path])
+    return blocks
+
+def pair_archive_blocks(blocks):
+    by_dir = defaultdict(list)
+    for path in blocks:
+        by_dir[os.path.dirname(path)].append(os.path.basename(path))
+    pairs = []
+    for directory, names in by_dir.items():
+        pairs.extend(pair_wmo_files(directory, names))
+    return pairs
+
+def pair_wmo_files(directory, names):
+    acs_files = [f for f in names if f.startswith("AR2025-") and f.endswith(".WMO")]
+    avaps_files = set(f for f in names if f.startswith("D") and f.endswith("_P.WMO"))
 
     pairs = []
 
@@ -55,15 +84,27 @@ def find_matching_pairs(directory):
             pairs.append((os.path.join(directory, acs), os.path.join(directory, avaps_name)))
     return pairs
 
-def main(directory, output_file="comparison_report.txt"):
-    total = 0
-    no_diff = 0
-    pairs = find_matching_pairs(directory)
+def main(directory, output_file="comparison_report.txt", catalog=None, compression=None):
+    blocks = None
+    if flight_archive.is_archive(directory):
+        blocks = read_archive_blocks(directory)
+        pairs = pair_archive_blocks(blocks)
+    else:
+        with profiling.stage("scan_directory") as st:
+            pairs = find_matching_pairs(directory)
+            st.samples += len(pairs)
     if not pairs:
         print("No matching file pairs found.")
         return
 
-    with open(output_file, 'w', encoding='utf-8') as out:
+    write_comparison_report(pairs, output_file, blocks, catalog=catalog, compression=compression)
+
+def write_comparison_report(pairs, output_file="comparison_report.txt", blocks=None, catalog=None, compression=None):
+    # blocks optionally maps file path -> already extracted XXAA block
+    total = 0
+    no_diff = 0
+    output_file = compressed_io.with_compression(output_file, compression)
+    with compressed_io.open_text(output_file, 'w', encoding='utf-8') as out:
         for file1, file2 in pairs:
             base1 = os.path.basename(file1)
             base2 = os.path.basename(file2)
@@ -71,10 +112,22 @@ def main(directory, output_file="comparison_report.txt"):
             print(f"Found matching AVAPS file: {base2}")
             out.write(f"Comparing:\n  ACS:   {base1}\n  AVAPS: {base2}\n\n")
 
-            xxaa1 = extract_xxaa_block(file1)
-            xxaa2 = extract_xxaa_block(file2)
-            diffs = compare_blocks(xxaa1, xxaa2)
+            if blocks is not None and file1 in blocks and file2 in blocks:
+                xxaa1 = blocks[file1]
+                xxaa2 = blocks[file2]
+            else:
+                with profiling.stage("extract_xxaa", file=base1) as st:
+                    xxaa1 = extract_xxaa_block(file1)
+                    xxaa2 = extract_xxaa_block(file2)
+                    st.bytes_read += os.path.getsize(file1) + os.path.getsize(file2)
+                    st.samples += len(xxaa1) + len(xxaa2)
+            with profiling.stage("compare", file=base1):
+                diffs = compare_blocks(xxaa1, xxaa2)
             total += 1
+            if catalog is not None:
+                drop_time = re.search(r'(\d{8})T(\d{6})', base1)
+                drop_time = f"{drop_time.group(1)}_{drop_time.group(2)}" if drop_time else None
+                catalog.record_wmo_comparison(file1, file2, drop_time, len(diffs))
 
             if not diffs:
                 no_diff += 1
@@ -97,8 +150,14 @@ def main(directory, output_file="comparison_report.txt"):
 
 
 if __name__ == "__main__":
-    import sys
-    if len(sys.argv) != 2:
-        print("Usage: python compare_wmo_directory.py <directory>")
-    else:
-        main(sys.argv[1])
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Compare the XXAA parts of matching ACS and AVAPS .WMO files in a directory.")
+    parser.add_argument("directory", help="Path to the directory containing .WMO files, or a .tar.gz/.zip flight archive")
+    compressed_io.add_arguments(parser)
+    catalog.add_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+
+    profiling.start_from_args(args, "aspen_compare")
+    with catalog.open_from_args(args) as cat:
+        main(args.directory, catalog=cat, compression=args.compress)
+    profiling.finish_from_args(args)
\ No newline at end of file
@@ -0,0 +1,346 @@
+import argparse
+import mmap
+import os
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+import sounding
+
+
+# Bytes-level AVAPS D file reader. The file is memory-mapped and record boundaries are found
+# with array operations on the raw bytes; the numeric part of every data line is handed to one
+# np.fromstring call, so no per-line Python strings are created for the (many) data lines.
+# Only the (few) AVAPS-T metadata lines and lines that don't have the usual fixed layout are
+# decoded one by one.
+#
+# Concatenated multi-drop logs are split into one drop per sonde ID and launch: AVAPS-T lines
+# belong to the sonde last announced on their channel (AVAPS-Tnn / AVAPS-Dnn), and each
+# "Launch Time" line for a sonde starts a new drop for that sonde.
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# D file data line columns: (name, field index, missing-value sentinel)
+#vals[0] is AVAPS-D01, vals[1] is Pxx LAU Axx, vals[3] is YYMMDD, vals[4] is HHMMSS.SS
+AVAPS_D_FIELDS = [
+    ("ID",            2,  None),            #Sonde ID
+    ("Pressure",      5,  "9999.00"),
+    ("Temperature",   6,  "99.00"),
+    ("Humidity",      7,  "999.00"),
+    ("WindDirection", 8,  "999.00"),
+    ("WindSpeed",     9,  "999.00"),
+    ("GpsDzDt",       10, "99.00"),         #Vertical Velocity (assume GPS?)
+    ("Longitude",     11, "999.000000"),
+    ("Latitude",      12, "99.000000"),
+    ("GeoAltitude",   13, "99999.00"),      #GeoPotential Altitude
+    ("GpsSats",       14, None),            #GPS Wind Sat
+    ("RH1",           15, "999.00"),        #unsure how this differs from Humidity above
+    ("RH2",           16, "999.00"),        #appears to always be 999.00
+    ("GpsSndSat",     17, None),            #GPS Snd Sat
+    ("wind_err",      18, "99.00"),
+    ("gps_alt",       19, "99999.00"),
+]
+
+# "AVAPS-D01 P00 " - the numeric tail of a data line (vals[2:20]) starts at this byte offset
+TAIL_OFFSET = 14
+TAIL_FIELDS = 20 - 2
+
+SPACE = np.uint8(ord(" "))
+
+
+class DFileDrop:
+    # One drop found in a D file: its data lines' numeric fields plus the lines that belong to it
+    __slots__ = ("sonde_id", "launch_time", "pressure_offset", "numbers", "lines")
+
+    def __init__(self, sonde_id):
+        self.sonde_id = sonde_id
+        self.launch_time = None      # "YYYY-MM-DDTHH:MM:SSZ" from the AVAPS-T Launch Time line
+        self.pressure_offset = None  # from the AVAPS-T Sonde Baseline Errors line
+        self.numbers = None          # (samples, TAIL_FIELDS) float64, vals[2:20] of each data line
+        self.lines = []              # line numbers (0-based) of every line of this drop, in file order
+
+
+def _map(path):
+    # mmap of the whole file; zero-length files can't be mapped
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _line_bounds(buf):
+    newlines = np.flatnonzero(buf == ord("\n"))
+    starts = np.concatenate(([0], newlines + 1))
+    ends = np.concatenate((newlines, [len(buf)]))
+    keep = starts < ends
+    return starts[keep], ends[keep]
+
+
+def _bytes_at(buf, starts, ends, offset):
+    # byte `offset` of each line, 0 where the line is shorter
+    idx = starts + offset
+    inside = idx < ends
+    out = np.zeros(len(starts), dtype=np.uint8)
+    out[inside] = buf[idx[inside]]
+    return out
+
+
+def _parse_tails(buf, starts, ends):
+    # vals[2:20] of many fixed-layout data lines in one np.fromstring call: everything outside
+    # the numeric tails is blanked, so lines are separated and their heads skipped
+    mark = np.zeros(len(buf) + 1, dtype=np.int8)
+    mark[starts + TAIL_OFFSET] = 1
+    mark[ends] -= 1
+    text = np.where(np.cumsum(mark[:-1], dtype=np.int8) > 0, buf, SPACE)
+    try:
+        numbers = np.fromstring(text.tobytes(), sep=" ")
+    except ValueError:
+        # a non-numeric field somewhere (e.g. "////")
+        return None
+    if numbers.size != len(starts) * TAIL_FIELDS:
+        return None
+    return numbers.reshape(len(starts), TAIL_FIELDS)
+
+
+def _parse_line(line):
+    # Slow path for one data line; None if it isn't a sounding (S/P) record or doesn't parse
+    vals = line.split()
+    if len(vals) < 20 or vals[1][:1] not in (b"S", b"P"):
+        return None
+    try:
+        return [float(v) for v in vals[2:20]]
+    except ValueError:
+        return None
+
+
+def _parse_metadata(line, drop):
+    label, _, value = line.partition(":")
+    label = label.strip()
+    value = value.strip()
+    if 'Launch Time' in label:
+        # Convert "YYYY-MM-DD, HH:MM:SS" to "YYYY-MM-DDTHH:MM:SSZ"
+        drop.launch_time = value.replace(", ", "T") + "Z"
+    elif 'Sonde Baseline Errors' in label:
+        try:
+            pressure_str = value.split(",")[0].strip()  # e.g., "-0.7 mb"
+            drop.pressure_offset = float(pressure_str.replace("mb", "").strip())
+        except ValueError:
+            print(f"Warning: Could not parse Pressure Offset from line: {line}")
+
+
+def _metadata_sonde_id(line):
+    # "AVAPS-T01 COM Sonde ID/Type/Rev/Built/Sensors: 240324590, RD41, ..." -> 240324590
+    label, _, value = line.partition(":")
+    if 'Sonde ID' not in label:
+        return None
+    try:
+        # AVAPS Sonde ID might look like "240324593, Model: LMS6"
+        return int(value.split(",")[0])
+    except ValueError:
+        print(f"Warning: Could not parse Sonde ID from line: {line}")
+        return None
+
+
+def scan(buf):
+    # -> ([DFileDrop] in order of first data line, line start offsets, line end offsets)
+    buf = np.frombuffer(buf, dtype=np.uint8)
+    starts, ends = _line_bounds(buf)
+
+    is_avaps = ends - starts > 8
+    for offset, char in enumerate(b"AVAPS-"):
+        is_avaps &= _bytes_at(buf, starts, ends, offset) == char
+    kind = _bytes_at(buf, starts, ends, 6)
+    channel = ((_bytes_at(buf, starts, ends, 7).astype(np.int16) - 48) * 10
+               + _bytes_at(buf, starts, ends, 8).astype(np.int16) - 48)
+    is_d = is_avaps & (kind == ord("D"))
+    is_t = is_avaps & (kind == ord("T"))
+
+    # "AVAPS-Dnn Snn|Pnn " data lines with the usual single-space layout take the fast path
+    record = _bytes_at(buf, starts, ends, 10)
+    fixed = (is_d & (ends - starts > TAIL_OFFSET)
+             & (_bytes_at(buf, starts, ends, 9) == ord(" ")) & (_bytes_at(buf, starts, ends, 13) == ord(" ")))
+    fast = np.flatnonzero(fixed & ((record == ord("S")) | (record == ord("P"))))
+    other_d = np.flatnonzero(is_d & ~fixed)
+    numbers = _parse_tails(buf, starts[fast], ends[fast]) if len(fast) else np.empty((0, TAIL_FIELDS))
+    if numbers is None:
+        # some line has a non-numeric field; decode those lines one at a time
+        other_d = np.union1d(other_d, fast)
+        fast = fast[:0]
+        numbers = np.empty((0, TAIL_FIELDS))
+
+    data_lines = [fast]
+    data_numbers = [numbers]
+    slow_lines, slow_numbers = [], []
+    for i in other_d.tolist():
+        values = _parse_line(bytes(buf[starts[i]:ends[i]]))
+        if values is not None:
+            slow_lines.append(i)
+            slow_numbers.append(values)
+    if slow_lines:
+        data_lines.append(np.array(slow_lines, dtype=np.int64))
+        data_numbers.append(np.array(slow_numbers, dtype=np.float64))
+    data_lines = np.concatenate(data_lines)
+    numbers = np.concatenate(data_numbers)
+    order = np.argsort(data_lines, kind="stable")
+    data_lines = data_lines[order]
+    numbers = numbers[order]
+    data_sondes = numbers[:, 0].astype(np.int64)
+    data_channels = channel[data_lines]
+
+    def next_sonde_on_channel(line, chan):
+        # sonde of the first data line on this channel after `line`, else the last before it
+        on_channel = np.flatnonzero(data_channels == chan)
+        if not len(on_channel):
+            return None
+        k = np.searchsorted(data_lines[on_channel], line)
+        return int(data_sondes[on_channel[min(k, len(on_channel) - 1)]])
+
+    # Metadata lines: which sonde each belongs to, and where each sonde's launches are
+    current_sonde = {}
+    meta = []  # (line number, sonde, text)
+    launches = {}  # sonde -> [line numbers of its Launch Time lines]
+    for i in np.flatnonzero(is_t).tolist():
+        text = bytes(buf[starts[i]:ends[i]]).decode("ascii", "replace").rstrip("\r")
+        chan = int(channel[i])
+        sonde_id = _metadata_sonde_id(text)
+        if sonde_id is not None:
+            current_sonde[chan] = sonde_id
+        else:
+            sonde_id = current_sonde.get(chan)
+            if sonde_id is None:
+                sonde_id = next_sonde_on_channel(i, chan)
+        meta.append((i, sonde_id, text))
+        if 'Launch Time' in text.partition(":")[0]:
+            launches.setdefault(sonde_id, []).append(i)
+
+    def segment(sonde_id, lines):
+        marks = launches.get(sonde_id)
+        if not marks:
+            return np.zeros(len(lines), dtype=np.int64)
+        return np.maximum(np.searchsorted(marks, lines, side="right") - 1, 0)
+
+    drops = {}
+    for sonde_id in dict.fromkeys(data_sondes.tolist()):
+        rows = np.flatnonzero(data_sondes == sonde_id)
+        segments = segment(sonde_id, data_lines[rows])
+        for seg in dict.fromkeys(segments.tolist()):
+            drop = drops[(sonde_id, seg)] = DFileDrop(sonde_id)
+            picked = rows[segments == seg]
+            drop.numbers = numbers[picked]
+            drop.lines = data_lines[picked].tolist()
+
+    for i, sonde_id, text in meta:
+        drop = drops.get((sonde_id, int(segment(sonde_id, [i])[0])))
+        if drop is None:
+            continue
+        _parse_metadata(text, drop)
+        drop.lines.append(i)
+
+    # LAU/Axx records carry the sonde ID too; keep them with their drop when splitting files
+    other_d = is_d.copy()
+    other_d[data_lines] = False
+    for i in np.flatnonzero(other_d).tolist():
+        vals = bytes(buf[starts[i]:ends[i]]).split()
+        try:
+            sonde_id = int(vals[2])
+        except (IndexError, ValueError):
+            continue
+        drop = drops.get((sonde_id, int(segment(sonde_id, [i])[0])))
+        if drop is not None:
+            drop.lines.append(i)
+
+    for drop in drops.values():
+        drop.lines.sort()
+    return list(drops.values()), starts, ends
+
+
+def drop_sounding(drop, source=None):
+    numbers = drop.numbers
+    # YYMMDD / HHMMSS.SS -> milliseconds since 1970-01-01 UTC
+    yymmdd = numbers[:, 1].astype(np.int64)
+    # only the few values where the date changes need to go through np.unique
+    days = np.unique(yymmdd[np.flatnonzero(np.diff(yymmdd, prepend=-1))])
+    day_index = np.searchsorted(days, yymmdd)
+    day_ms = np.array([(datetime(2000 + d // 10000, d // 100 % 100, d % 100, tzinfo=timezone.utc) - EPOCH)
+                       // timedelta(milliseconds=1) for d in days.tolist()], dtype=np.int64)
+    hhmmss = numbers[:, 2]
+    hours = (hhmmss // 10000).astype(np.int64)
+    minutes = (hhmmss // 100 % 100).astype(np.int64)
+    seconds = hhmmss - hours * 10000 - minutes * 100
+    times = (day_ms[day_index] + hours * 3600000 + minutes * 60000
+             + np.rint(seconds * 1000).astype(np.int64))
+
+    columns = {}
+    for name, i, missing in AVAPS_D_FIELDS:
+        values = numbers[:, i - 2].copy()
+        if missing is not None:
+            values[values == float(missing)] = np.nan
+        columns[name] = values
+    return sounding.from_samples(times, columns, source=source, sonde_id=drop.sonde_id,
+                                 launch_time=drop.launch_time, pressure_offset=drop.pressure_offset)
+
+
+def read_drops(d_file, data=None):
+    # -> [Sounding] for every drop in the file, in order of first appearance.
+    # `data` is the file's content when it is already in memory (e.g. an archive member).
+    if data is not None:
+        drops, _, _ = scan(data)
+        return [drop_sounding(drop, source=d_file) for drop in drops]
+    mapped = _map(d_file)
+    try:
+        drops, _, _ = scan(mapped)
+    finally:
+        if isinstance(mapped, mmap.mmap):
+            mapped.close()
+    return [drop_sounding(drop, source=d_file) for drop in drops]
+
+
+def split_d_file(d_file, output_dir):
+    # Writes each drop of a multi-drop file as its own D file (D<launch>.1), bytes copied as-is
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+    mapped = _map(d_file)
+    try:
+        drops, starts, ends = scan(mapped)
+        for drop in drops:
+            stamp = drop_sounding(drop).times[:1]
+            if drop.launch_time:
+                name = datetime.strptime(drop.launch_time, "%Y-%m-%dT%H:%M:%SZ").strftime("D%Y%m%d_%H%M%S")
+            elif len(stamp):
+                name = (EPOCH + timedelta(milliseconds=int(stamp[0]))).strftime("D%Y%m%d_%H%M%S")
+            else:
+                name = f"D_{drop.sonde_id}"
+            path = os.path.join(output_dir, f"{name}.1")
+            with open(path, "wb") as out:
+                for i in drop.lines:
+                    out.write(mapped[starts[i]:ends[i]].rstrip(b"\r") + b"\n")
+            written.append((path, drop))
+    finally:
+        if isinstance(mapped, mmap.mmap):
+            mapped.close()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List (and optionally split out) the drops in an AVAPS D file.")
+    parser.add_argument("d_file", help="AVAPS D file, possibly holding several concatenated drops")
+    parser.add_argument("--split", metavar="DIR", default=None,
+                        help="Write each drop to its own D<launch time>.1 file in DIR")
+    args = parser.parse_args()
+
+    if args.split:
+        for path, drop in split_d_file(args.d_file, args.split):
+            print(f"{path}: sonde {drop.sonde_id}, launch {drop.launch_time or 'unknown'}, "
+                  f"{len(drop.numbers)} samples")
+        return
+
+    drops = read_drops(args.d_file)
+    print(f"{len(drops)} drop(s) in {args.d_file}:")
+    for drop in drops:
+        tags = drop.timetags()
+        span = f"{tags[0]} .. {tags[-1]}" if tags else "no samples"
+        print(f"  sonde {drop.sonde_id}, launch {drop.launch_time or 'unknown'}, {len(drop)} samples, {span}")
+
+
+if __name__ == "__main__":
+    main()
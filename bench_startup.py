@@ -0,0 +1,88 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+# Cold-start benchmark: how long each script takes to start in a fresh interpreter,
+# which dominates small jobs run from shell loops and cron hooks.
+
+# script -> arguments that make it start up and exit without doing any work
+SCRIPTS = {
+    "acs_avaps_compare.py": ["--help"],
+    "csv_process.py": ["--help"],
+    "decode_xxaa_directory.py": ["--help"],
+    "compare_acs_avaps_csv.py": ["--help"],
+    "aspen_compare.py": ["--help"],
+    "show_drop_pressure_addition.py": [],  # prints its usage message
+    "campaign_pipeline.py": ["--help"],
+    "catalog.py": ["--help"],
+    "comparison_service.py": ["--help"],
+    "avaps_dfile.py": ["--help"],
+    "rank_drops.py": ["--help"],
+    "verify_xxaa.py": ["--help"],
+}
+
+
+def time_command(cmd, repeats, cwd):
+    samples = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        subprocess.run(cmd, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        samples.append(time.perf_counter() - t0)
+    return {"min_s": min(samples), "median_s": statistics.median(samples), "repeats": repeats}
+
+
+def run_benchmark(repeats=5):
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {"python": sys.version.split()[0],
+               "interpreter": time_command([sys.executable, "-c", "pass"], repeats, here),
+               "scripts": {}}
+    for script, script_args in SCRIPTS.items():
+        module = script[:-3]
+        results["scripts"][script] = {
+            # import only (what a caller pays to use the functions)
+            "import": time_command([sys.executable, "-c", f"import {module}"], repeats, here),
+            # full CLI start-up up to argument parsing
+            "usage": time_command([sys.executable, script] + script_args, repeats, here),
+        }
+    return results
+
+
+def format_table(results):
+    base = results["interpreter"]["median_s"]
+    lines = [f"Cold start (Python {results['python']}), median of {results['interpreter']['repeats']} runs;"
+             f" bare interpreter {base * 1000:.1f} ms",
+             f"  {'script':<34} {'import ms':>10} {'usage ms':>10} {'over python':>12}"]
+    for script, r in results["scripts"].items():
+        lines.append(f"  {script:<34} {r['import']['median_s'] * 1000:10.1f} {r['usage']['median_s'] * 1000:10.1f} "
+                     f"{(r['usage']['median_s'] - base) * 1000:12.1f}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start time of each comparison script.")
+    parser.add_argument("--repeats", type=int, default=5, help="Runs per measurement (default: 5)")
+    parser.add_argument("--json", metavar="PATH", default=None,
+                        help="Also write the results to this JSON file (merged into it if it already exists)")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.repeats)
+    print(format_table(results))
+
+    if args.json:
+        existing = {}
+        if os.path.exists(args.json):
+            with open(args.json) as f:
+                existing = json.load(f)
+        existing["cold_start"] = results
+        with open(args.json, "w") as f:
+            json.dump(existing, f, indent=2)
+        print(f"Cold-start results written to: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import argparse
+import itertools
+import os
+import re
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import acs_avaps_compare
+import aspen_compare
+import catalog
+import clock_offset
+import compare_acs_avaps_csv
+import compressed_io
+import csv_process
+import decode_xxaa_directory
+import drop_bootstrap
+import profiling
+import resample
+
+
+# Single-pass campaign run: discovers every input once, then runs
+#   acs_avaps_compare -> csv_process                         (per-drop CSVs + summary)
+#   decode_xxaa_directory -> compare_acs_avaps_csv, aspen_compare   (XXAA reports)
+# passing results between stages in memory instead of re-reading each other's output files.
+
+
+class CampaignFiles:
+    def __init__(self):
+        self.netcdf_files = []
+        self.d_files = []
+        self.wmo_files = []
+
+
+def discover(directory):
+    # One walk over the campaign tree; everything downstream works from these lists
+    files = CampaignFiles()
+    with profiling.stage("scan_directory") as st:
+        for dirpath, dirnames, filenames in os.walk(directory):
+            dirnames.sort()
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                if name.endswith(".nc"):
+                    files.netcdf_files.append(path)
+                elif name.endswith(".WMO"):
+                    files.wmo_files.append(path)
+                elif re.match(r'D\d{8}_\d{6}\.', name):
+                    files.d_files.append(path)
+        st.samples += len(files.netcdf_files) + len(files.d_files) + len(files.wmo_files)
+    return files
+
+
+def pair_drops(files, catalog=None):
+    d_index = acs_avaps_compare.index_d_files(files.d_files)
+    pairs = {}
+    for nc_file in files.netcdf_files:
+        launch_time = acs_avaps_compare.extract_launch_time(os.path.basename(nc_file))
+        d_file = acs_avaps_compare.lookup_d_file(d_index, os.path.dirname(nc_file), launch_time)
+        print(f"{nc_file} -> Launch time: {launch_time} -> D file: {d_file if d_file else 'NOT FOUND'}")
+        if catalog is not None:
+            if d_file:
+                # sonde metadata follows from the soundings once the drop is compared
+                catalog.record_drop(launch_time, nc_file, d_file)
+            else:
+                acs_avaps_compare.record_drop(catalog, nc_file, d_file, launch_time)
+        if d_file:
+            # Same launch time twice would overwrite the same processed CSV; keep the last, as a sequential run does
+            pairs[launch_time] = (nc_file, d_file)
+    return pairs
+
+
+def _compare_drop(nc_file, d_file, launch_time, output_dir, compression, grid, clock):
+    # Runs in a worker process, through profiling.run_profiled
+    offsets = {}
+    soundings = acs_avaps_compare.read_inputs(nc_file, d_file, launch_time)
+    table = acs_avaps_compare.compare_soundings(*soundings, launch_time, grid, clock, offsets)
+    acs_avaps_compare.write_output(table, launch_time, output_dir, compression)
+    return table, acs_avaps_compare.sounding_metadata(*soundings), offsets
+
+
+def _read_pair(item):
+    launch_time, (nc_file, d_file) = item
+    return acs_avaps_compare.read_inputs(nc_file, d_file, launch_time)
+
+
+def run_drop_stages(pairs, processed_dir, jobs, catalog=None, compression=None, prefetch=2, grid=None,
+                    clock=None, bootstrap=None):
+    # Each comparison table is catalogued and summarized for csv_process as soon as it is ready,
+    # then dropped, so memory doesn't grow with the number of drops; only the per-drop summary
+    # texts wait for the report, which lists drops in launch time order. Returns the drop count.
+    global_data = defaultdict(list)
+    summaries = {}
+    offsets = {}
+
+    def finish(launch_time, table, metadata):
+        if catalog is not None:
+            catalog.record_drop(launch_time, **metadata)
+        summaries[launch_time] = csv_process.analyze_table(f"{launch_time}.csv", table, global_data, catalog,
+                                                           bootstrap)
+
+    if jobs > 1:
+        # at most 2 * jobs drops submitted at once: the workers stay busy without finished
+        # tables queueing up in this process
+        tool = profiling.worker_tool()
+        queued = iter(pairs.items())
+        running = {}  # future -> launch time
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            while True:
+                for launch_time, (nc_file, d_file) in itertools.islice(queued, 2 * jobs - len(running)):
+                    future = pool.submit(profiling.run_profiled, tool, _compare_drop, nc_file, d_file, launch_time,
+                                         processed_dir, compression, grid, clock)
+                    running[future] = launch_time
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    launch_time = running.pop(future)
+                    (table, metadata, drop_offsets), report = future.result()
+                    offsets.update(drop_offsets)
+                    profiling.merge_worker(report)
+                    finish(launch_time, table, metadata)
+    else:
+        # Single process: still read the next `prefetch` drops while this one is compared and written
+        reads = acs_avaps_compare.prefetched(_read_pair, pairs.items(), prefetch)
+        for i, ((launch_time, _), soundings) in enumerate(zip(pairs.items(), reads), start=1):
+            print(f"Processing drop {i} of {len(pairs)}: {launch_time}")
+            table = acs_avaps_compare.compare_soundings(*soundings, launch_time, grid, clock, offsets)
+            acs_avaps_compare.write_output(table, launch_time, processed_dir, compression)
+            finish(launch_time, table, acs_avaps_compare.sounding_metadata(*soundings))
+
+    acs_avaps_compare.save_offsets(offsets, processed_dir, catalog, compression, clock)
+
+    if not summaries:
+        print("No ACS/AVAPS drop pairs found.")
+        return 0
+
+    summary_output = [summaries[launch_time] for launch_time in sorted(summaries)]
+    csv_process.write_summary_report(processed_dir, summary_output, global_data, len(summaries), compression,
+                                     bootstrap)
+    return len(summaries)
+
+
+def run_wmo_stages(wmo_files, output_dir, catalog=None, compression=None):
+    # Extract each XXAA block once and share it between the decoder and the text comparison
+    blocks = {}
+    records = []
+    for path in wmo_files:
+        name = os.path.basename(path)
+        with profiling.stage("extract_xxaa", file=name) as st:
+            blocks[path] = decode_xxaa_directory.extract_xxaa_block(path)
+            st.bytes_read += os.path.getsize(path)
+            st.samples += len(blocks[path])
+        decoded = decode_xxaa_directory.decode_file_block(name, blocks[path])
+        if decoded:
+            records.append(decoded)
+
+    if records:
+        decode_xxaa_directory.write_decoded_csv(records, os.path.join(output_dir, "decoded_xxaa.csv"), compression)
+        data = compare_acs_avaps_csv.index_rows(compare_acs_avaps_csv.rows_from_records(records))
+        compare_acs_avaps_csv.write_comparison_report(data, os.path.join(output_dir, "csv_comparison_report.txt"),
+                                                      catalog, compression)
+    else:
+        print("No XXAA data decoded.")
+
+    by_dir = defaultdict(list)
+    for path in wmo_files:
+        by_dir[os.path.dirname(path)].append(os.path.basename(path))
+    pairs = []
+    for directory, names in by_dir.items():
+        pairs.extend(aspen_compare.pair_wmo_files(directory, names))
+    if pairs:
+        aspen_compare.write_comparison_report(pairs, os.path.join(output_dir, "comparison_report.txt"), blocks,
+                                              catalog, compression)
+    else:
+        print("No matching file pairs found.")
+    return records
+
+
+def run_campaign(directory, output_dir=".", jobs=None, catalog=None, compression=None, prefetch=2, grid=None,
+                 clock=None, bootstrap=None):
+    files = discover(directory)
+    print(f"Found {len(files.netcdf_files)} NetCDF files, {len(files.d_files)} D files, "
+          f"{len(files.wmo_files)} WMO files.")
+    pairs = pair_drops(files, catalog)
+
+    processed_dir = os.path.join(output_dir, "processed")
+    os.makedirs(processed_dir, exist_ok=True)
+    jobs = jobs or os.cpu_count() or 1
+
+    # The WMO branch is independent of the NetCDF/D-file branch, so run it alongside
+    with ThreadPoolExecutor(max_workers=1) as side:
+        wmo_future = side.submit(run_wmo_stages, files.wmo_files, output_dir, catalog, compression)
+        run_drop_stages(pairs, processed_dir, jobs, catalog, compression, prefetch, grid, clock, bootstrap)
+        wmo_future.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the full ACS vs AVAPS campaign analysis in one pass.")
+    parser.add_argument("directory", help="Path to the campaign directory (.nc, D files and .WMO messages)")
+    parser.add_argument("--output-dir", default=".", help="Where to write processed/ and the reports (default: .)")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Worker processes for per-drop comparisons (default: CPU count)")
+    parser.add_argument("--prefetch", type=int, default=2, metavar="K",
+                        help="With --jobs 1, read up to K drops ahead while comparing (0 = off, default: 2)")
+    compressed_io.add_arguments(parser)
+    resample.add_arguments(parser)
+    clock_offset.add_arguments(parser)
+    drop_bootstrap.add_arguments(parser)
+    catalog.add_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    grid = resample.grid_from_args(args)
+
+    if not os.path.isdir(args.directory):
+        print(f"Error: {args.directory} is not a valid directory.")
+        return
+
+    profiling.start_from_args(args, "campaign_pipeline")
+    with catalog.open_from_args(args) as cat:
+        run_campaign(args.directory, args.output_dir, args.jobs, cat, args.compress, args.prefetch, grid,
+                     clock_offset.from_args(args), drop_bootstrap.from_args(args))
+    profiling.finish_from_args(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+import argparse
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+
+# SQLite catalog of drops, input files and comparison results, filled in by the
+# comparison scripts when run with --catalog, so questions like "which drops exceeded
+# the temperature tolerance last week?" don't need a rescan of the raw files or reports.
+#
+# Drop/launch times are stored as the "YYYYMMDD_HHMMSS" strings used throughout the
+# scripts, which sort chronologically, so time ranges are plain indexed string compares.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS drops (
+    launch_time           TEXT PRIMARY KEY,
+    netcdf_path           TEXT,
+    d_file_path           TEXT,
+    paired                INTEGER NOT NULL DEFAULT 0,
+    acs_sonde_id          TEXT,
+    avaps_sonde_id        TEXT,
+    acs_pressure_offset   REAL,
+    avaps_pressure_offset REAL,
+    clock_offset_ms       REAL,
+    clock_correlation     REAL,
+    updated_at            TEXT
+);
+CREATE INDEX IF NOT EXISTS drops_acs_sonde ON drops (acs_sonde_id);
+CREATE INDEX IF NOT EXISTS drops_avaps_sonde ON drops (avaps_sonde_id);
+CREATE INDEX IF NOT EXISTS drops_paired ON drops (paired, launch_time);
+
+-- per-drop csv_process statistics, one row per difference column
+CREATE TABLE IF NOT EXISTS variable_stats (
+    launch_time      TEXT NOT NULL,
+    variable         TEXT NOT NULL,
+    total            INTEGER,
+    mean             REAL,
+    std              REAL,
+    min              REAL,
+    max              REAL,
+    within_threshold INTEGER,
+    threshold        REAL,
+    exceeded         INTEGER,
+    PRIMARY KEY (launch_time, variable)
+);
+CREATE INDEX IF NOT EXISTS variable_stats_exceeded ON variable_stats (variable, exceeded, launch_time);
+
+-- compare_acs_avaps_csv results for decoded XXAA messages
+CREATE TABLE IF NOT EXISTS xxaa_comparisons (
+    drop_time  TEXT PRIMARY KEY,
+    acs_file   TEXT,
+    avaps_file TEXT,
+    tolerated  INTEGER,
+    exceeded   INTEGER
+);
+CREATE TABLE IF NOT EXISTS xxaa_field_diffs (
+    drop_time TEXT NOT NULL,
+    field     TEXT NOT NULL,
+    acs_value   TEXT,
+    avaps_value TEXT,
+    diff      REAL,
+    tolerated INTEGER,
+    PRIMARY KEY (drop_time, field)
+);
+
+-- aspen_compare line-by-line XXAA text comparisons
+CREATE TABLE IF NOT EXISTS wmo_comparisons (
+    acs_file    TEXT PRIMARY KEY,
+    avaps_file  TEXT,
+    drop_time   TEXT,
+    diff_lines  INTEGER
+);
+CREATE INDEX IF NOT EXISTS wmo_comparisons_drop ON wmo_comparisons (drop_time);
+"""
+
+
+def _launch_time_from_name(name):
+    # '20250223_203707.csv' -> '20250223_203707'
+    return os.path.basename(name).split(".")[0]
+
+
+class Catalog:
+    def __init__(self, path):
+        import sqlite3
+
+        self.path = path
+        # Connection is shared between the pipeline's threads; writes are serialized by the lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        # catalogs created before the clock offset columns existed
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(drops)")}
+        for column in ("clock_offset_ms", "clock_correlation"):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE drops ADD COLUMN {column} REAL")
+        self._lock = threading.Lock()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            self.conn.execute(sql, params)
+
+    def record_drop(self, launch_time, netcdf_path=None, d_file_path=None, acs_sonde_id=None,
+                    avaps_sonde_id=None, acs_pressure_offset=None, avaps_pressure_offset=None):
+        self._execute(
+            """INSERT INTO drops (launch_time, netcdf_path, d_file_path, paired, acs_sonde_id, avaps_sonde_id,
+                                  acs_pressure_offset, avaps_pressure_offset, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT (launch_time) DO UPDATE SET
+                   netcdf_path = COALESCE(excluded.netcdf_path, netcdf_path),
+                   d_file_path = COALESCE(excluded.d_file_path, d_file_path),
+                   paired = MAX(excluded.paired, paired),
+                   acs_sonde_id = COALESCE(excluded.acs_sonde_id, acs_sonde_id),
+                   avaps_sonde_id = COALESCE(excluded.avaps_sonde_id, avaps_sonde_id),
+                   acs_pressure_offset = COALESCE(excluded.acs_pressure_offset, acs_pressure_offset),
+                   avaps_pressure_offset = COALESCE(excluded.avaps_pressure_offset, avaps_pressure_offset),
+                   updated_at = excluded.updated_at""",
+            (launch_time, netcdf_path, d_file_path, int(bool(netcdf_path and d_file_path)),
+             None if acs_sonde_id is None else str(acs_sonde_id),
+             None if avaps_sonde_id is None else str(avaps_sonde_id),
+             acs_pressure_offset, avaps_pressure_offset,
+             datetime.now(timezone.utc).isoformat(timespec="seconds")))
+
+    def record_clock_offset(self, launch_time, offset_ms, correlation):
+        # offset_ms/correlation None: estimated but not determined (clears an earlier estimate)
+        self._execute(
+            """INSERT INTO drops (launch_time, clock_offset_ms, clock_correlation, updated_at) VALUES (?, ?, ?, ?)
+               ON CONFLICT (launch_time) DO UPDATE SET
+                   clock_offset_ms = excluded.clock_offset_ms,
+                   clock_correlation = excluded.clock_correlation,
+                   updated_at = excluded.updated_at""",
+            (launch_time, offset_ms, correlation, datetime.now(timezone.utc).isoformat(timespec="seconds")))
+
+    def record_variable_stats(self, file_name, variable, stats, threshold):
+        # variable: csv_process.variable_name of the difference column
+        self._execute(
+            """INSERT OR REPLACE INTO variable_stats
+               (launch_time, variable, total, mean, std, min, max, within_threshold, threshold, exceeded)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (_launch_time_from_name(file_name), variable, stats['total'], stats['mean'],
+             stats['std'], stats['min'], stats['max'], stats['within_threshold'], threshold,
+             stats['total'] - stats['within_threshold']))
+
+    def record_xxaa_comparison(self, drop_time, acs_file, avaps_file, diffs, tolerated, exceeded):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO xxaa_comparisons VALUES (?, ?, ?, ?, ?)",
+                (drop_time, acs_file, avaps_file, tolerated, exceeded))
+            self.conn.execute("DELETE FROM xxaa_field_diffs WHERE drop_time = ?", (drop_time,))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO xxaa_field_diffs VALUES (?, ?, ?, ?, ?, ?)",
+                [(drop_time, field, a, b, diff, int(tol)) for field, a, b, diff, tol in diffs if a != b])
+
+    def record_wmo_comparison(self, acs_file, avaps_file, drop_time, diff_lines):
+        self._execute(
+            "INSERT OR REPLACE INTO wmo_comparisons VALUES (?, ?, ?, ?)",
+            (os.path.basename(acs_file), os.path.basename(avaps_file), drop_time, diff_lines))
+
+    def commit(self):
+        with self._lock:
+            self.conn.commit()
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+    # Queries
+
+    def query(self, sql, params=()):
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def exceeded_drops(self, variable, since=None, until=None):
+        return self.query(
+            """SELECT launch_time, exceeded, total, mean, min, max FROM variable_stats
+               WHERE variable = ? AND exceeded > 0 AND launch_time >= ? AND launch_time < ?
+               ORDER BY launch_time""",
+            (variable, since or "", until or "~"))
+
+    def unpaired_sondes(self):
+        # Drops with a NetCDF file but no matching D file
+        return self.query(
+            """SELECT launch_time, acs_sonde_id, netcdf_path FROM drops
+               WHERE paired = 0 AND netcdf_path IS NOT NULL ORDER BY launch_time""")
+
+    def drop(self, launch_time):
+        return self.query("SELECT * FROM drops WHERE launch_time = ?", (launch_time,))
+
+
+@contextmanager
+def open_catalog(path):
+    # Yields None when no catalog path is given, so callers can pass it straight through
+    if not path:
+        yield None
+        return
+    catalog = Catalog(path)
+    try:
+        yield catalog
+    finally:
+        catalog.close()
+
+
+def add_arguments(parser):
+    parser.add_argument("--catalog", metavar="SQLITE", default=None,
+                        help="Record drops, files and comparison results in this SQLite catalog")
+
+
+def open_from_args(args):
+    return open_catalog(args.catalog)
+
+
+def _print_rows(rows):
+    for row in rows:
+        print("  ".join("" if v is None else str(v) for v in row))
+    print(f"({len(rows)} row(s))")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the ACS/AVAPS comparison catalog.")
+    parser.add_argument("catalog", help="Path to the SQLite catalog")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    exceeded = sub.add_parser("exceeded", help="Drops whose differences exceeded the tolerance for a variable")
+    exceeded.add_argument("variable", help="e.g. Temperature, Pressure, Humidity, U, V")
+    exceeded.add_argument("--since", help="Earliest launch time, YYYYMMDD[_HHMMSS]")
+    exceeded.add_argument("--until", help="Latest launch time (exclusive), YYYYMMDD[_HHMMSS]")
+    exceeded.add_argument("--days", type=int, help="Only drops launched in the last N days")
+
+    sub.add_parser("unpaired", help="Sondes with a NetCDF file but no D file")
+
+    drop = sub.add_parser("drop", help="Catalog entry for one launch time")
+    drop.add_argument("launch_time", help="YYYYMMDD_HHMMSS")
+
+    sql = sub.add_parser("sql", help="Run an arbitrary SQL query against the catalog")
+    sql.add_argument("query")
+
+    args = parser.parse_args()
+    if not os.path.exists(args.catalog):
+        print(f"Error: {args.catalog} does not exist.")
+        return
+
+    with open_catalog(args.catalog) as cat:
+        if args.command == "exceeded":
+            since = args.since
+            if args.days is not None:
+                since = (datetime.now(timezone.utc) - timedelta(days=args.days)).strftime("%Y%m%d_%H%M%S")
+            _print_rows(cat.exceeded_drops(args.variable, since, args.until))
+        elif args.command == "unpaired":
+            _print_rows(cat.unpaired_sondes())
+        elif args.command == "drop":
+            _print_rows(cat.drop(args.launch_time))
+        elif args.command == "sql":
+            _print_rows(cat.query(args.query))
+
+
+if __name__ == "__main__":
+    main()
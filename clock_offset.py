@@ -0,0 +1,200 @@
+import csv
+import os
+
+import compressed_io
+import resample
+
+
+# Estimates a constant clock (GpsUtcTime) offset between the ACS and AVAPS soundings of a drop.
+# Pressure and temperature are interpolated onto one uniform time grid and differenced sample
+# to sample, which removes constant sensor biases (a pressure bias must not look like a time
+# shift) and leaves the changes that line up in time. For each variable, the normalized
+# cross-correlation over every lag within +-max_lag_s is computed with FFTs, counting only
+# samples valid in both series; the lag where the summed correlations peak, refined with a
+# parabola through its neighbours, is the offset. A peak below min_correlation (featureless or
+# unrelated series) gives no offset rather than a meaningless one.
+#
+# offset_ms > 0 means the ACS clock runs ahead: ACS at t + offset matches AVAPS at t. Offsets
+# smaller than one grid step are within the estimate's resolution and reported as 0.
+#
+# NumPy is imported by the estimation functions only, so adding the options costs nothing.
+
+CORRELATED_COLUMNS = ("Pressure", "Temperature")
+
+OUTPUT_FIELDS = ["launch_time", "offset_ms", "correlation", "applied"]
+
+
+class ClockOffset:
+    __slots__ = ("offset_ms", "correlation")
+
+    def __init__(self, offset_ms, correlation):
+        self.offset_ms = offset_ms
+        self.correlation = correlation
+
+
+class OffsetEstimator:
+    __slots__ = ("max_lag_s", "hz", "apply", "min_overlap", "min_correlation", "max_gap_s")
+
+    def __init__(self, max_lag_s=10.0, hz=10.0, apply=False, min_overlap=0.5, min_correlation=0.2, max_gap_s=2.0):
+        self.max_lag_s = max_lag_s
+        self.hz = hz
+        self.apply = apply
+        self.min_overlap = min_overlap  # fraction of the shorter series that must overlap at a lag
+        self.min_correlation = min_correlation
+        self.max_gap_s = max_gap_s
+
+    def estimate(self, acs_sounding, avaps_sounding):
+        return estimate_offset(acs_sounding, avaps_sounding, self.max_lag_s, self.hz, self.min_overlap,
+                               self.min_correlation, self.max_gap_s)
+
+
+def masked_correlation(x, y, max_lag):
+    # x, y: equal-length series with NaN gaps. Returns (corr, overlap) for lags -max_lag..max_lag,
+    # where corr is the normalized correlation of x[i + lag] with y[i] over the samples valid in
+    # both and overlap is the number of those samples.
+    import numpy as np
+
+    mx = ~np.isnan(x)
+    my = ~np.isnan(y)
+    x0 = np.where(mx, x - np.nanmean(x), 0.0)
+    y0 = np.where(my, y - np.nanmean(y), 0.0)
+    nfft = 1 << (len(x) + max_lag - 1).bit_length()  # long enough that lags up to max_lag don't wrap
+
+    def spectrum(a):
+        return np.fft.rfft(a, nfft)
+
+    def correlate(fa, fb):
+        c = np.fft.irfft(fa * np.conj(fb), nfft)
+        return np.concatenate([c[nfft - max_lag:], c[:max_lag + 1]])
+
+    fmx, fmy = spectrum(mx.astype(np.float64)), spectrum(my.astype(np.float64))
+    numerator = correlate(spectrum(x0), spectrum(y0))
+    energy_x = correlate(spectrum(x0 * x0), fmy)
+    energy_y = correlate(fmx, spectrum(y0 * y0))
+    overlap = np.rint(correlate(fmx, fmy))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        corr = numerator / np.sqrt(energy_x * energy_y)
+    corr[~np.isfinite(corr)] = np.nan
+    return corr, overlap
+
+
+def varies(diffs):
+    # False for a differenced series that is constant up to float noise (a linear profile): its
+    # correlation would only measure the noise, not timing
+    import numpy as np
+
+    scale = np.nanmax(np.abs(diffs))
+    return bool(np.nanstd(diffs) > 1e-6 * scale)
+
+
+def estimate_offset(acs_sounding, avaps_sounding, max_lag_s=10.0, hz=10.0, min_overlap=0.5, min_correlation=0.2,
+                    max_gap_s=2.0):
+    # ClockOffset, or None when the soundings have too little in common to tell
+    import numpy as np
+
+    if not len(acs_sounding) or not len(avaps_sounding):
+        return None
+    grid = resample.Grid(hz, max_gap_s)
+    grid_times = grid.times(min(acs_sounding.times[0], avaps_sounding.times[0]),
+                            max(acs_sounding.times[-1], avaps_sounding.times[-1]))
+    max_lag = int(round(max_lag_s * hz))
+    if len(grid_times) < 4 or max_lag < 1:
+        return None
+
+    total = np.zeros(2 * max_lag + 1)
+    used = 0
+    for column in CORRELATED_COLUMNS:
+        if column not in acs_sounding or column not in avaps_sounding:
+            continue
+        x, y = (np.diff(resample.interpolate(snd.times, snd[column].astype(np.float64), grid_times,
+                                             grid.max_gap_s * 1000.0))
+                for snd in (acs_sounding, avaps_sounding))
+        shorter = min(np.count_nonzero(~np.isnan(x)), np.count_nonzero(~np.isnan(y)))
+        if shorter < 3 or not (varies(x) and varies(y)):
+            continue
+        corr, overlap = masked_correlation(x, y, max_lag)
+        corr[overlap < max(3, min_overlap * shorter)] = np.nan
+        total += corr
+        used += 1
+    if not used or np.isnan(total).all():
+        return None
+
+    total /= used
+    j = int(np.nanargmax(total))
+    if total[j] < min_correlation:
+        return None
+    shift = 0.0
+    if 0 < j < len(total) - 1 and np.isfinite(total[j - 1]) and np.isfinite(total[j + 1]):
+        curvature = total[j - 1] - 2 * total[j] + total[j + 1]
+        if curvature < 0:
+            shift = 0.5 * (total[j - 1] - total[j + 1]) / curvature
+    offset_ms = int(round((j - max_lag + shift) * grid.step_ms))
+    if abs(offset_ms) < grid.step_ms:
+        offset_ms = 0
+    return ClockOffset(offset_ms, float(total[j]))
+
+
+def shift_sounding(snd, offset_ms):
+    # The sounding on the other system's clock: times moved back by offset_ms
+    import sounding
+
+    return sounding.Sounding(snd.times - offset_ms, dict(snd.columns), source=snd.source, sonde_id=snd.sonde_id,
+                             launch_time=snd.launch_time, pressure_offset=snd.pressure_offset)
+
+
+def apply_offset(acs_sounding, avaps_sounding, offset, grid=None):
+    # ACS sounding moved onto the AVAPS clock. Without a common grid the comparison matches
+    # identical timetags, so the shifted ACS sounding is interpolated onto the AVAPS timetags.
+    if not offset.offset_ms:
+        return acs_sounding
+    shifted = shift_sounding(acs_sounding, offset.offset_ms)
+    if grid is not None:
+        return shifted
+    return resample.resample_sounding(shifted, avaps_sounding.times, 2000.0)
+
+
+def format_offset(launch_time, offset, applied=False):
+    if offset is None:
+        return f"Clock offset {launch_time}: not determined"
+    return (f"Clock offset {launch_time}: ACS {offset.offset_ms / 1000:+.2f} s vs AVAPS "
+            f"(correlation {offset.correlation:.2f}{', applied' if applied else ''})")
+
+
+def save_offsets(offsets, output_dir, catalog=None, compression=None, applied=False):
+    # offsets: {launch time: ClockOffset or None} -> clock_offsets.csv in output_dir, and the catalog's drops
+    if not offsets:
+        return None
+    os.makedirs(output_dir, exist_ok=True)
+    path = compressed_io.with_compression(os.path.join(output_dir, "clock_offsets.csv"), compression)
+    with compressed_io.open_text(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(OUTPUT_FIELDS)
+        for launch_time, offset in sorted(offsets.items()):
+            if offset is None:
+                writer.writerow([launch_time, "", "", 0])
+            else:
+                writer.writerow([launch_time, offset.offset_ms, round(offset.correlation, 4),
+                                 int(applied and offset.offset_ms != 0)])
+    if catalog is not None:
+        for launch_time, offset in offsets.items():
+            catalog.record_clock_offset(launch_time, None if offset is None else offset.offset_ms,
+                                        None if offset is None else offset.correlation)
+    print(f"Clock offsets written to: {path}")
+    return path
+
+
+def add_arguments(parser):
+    parser.add_argument("--clock-offset", choices=("report", "apply", "off"), default="off",
+                        help="Estimate each drop's ACS vs AVAPS clock offset by cross-correlating pressure and "
+                             "temperature: report it, also apply it before differencing, or skip (default: off)")
+    parser.add_argument("--max-lag", type=float, default=10.0, metavar="SECONDS",
+                        help="Largest clock offset searched for (default: 10)")
+
+
+def from_args(args):
+    # None unless --clock-offset report or apply was given
+    if args.clock_offset == "off":
+        return None
+    if args.max_lag <= 0:
+        raise SystemExit("--max-lag must be positive")
+    return OffsetEstimator(args.max_lag, apply=args.clock_offset == "apply")
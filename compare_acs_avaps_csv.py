@@ -1,23 +1,63 @@
 import csv
-import sys
+import os
+import argparse
+import catalog
+import compressed_io
+import profiling
 from collections import defaultdict
 
+FIELDS_TO_COMPARE = [
+    'latitude', 'longitude', 'marsden', 'units',
+    'surface_temp_C', 'surface_dewpt_dep_C', 'surface_wind_dir_deg', 'surface_wind_spd_kt'
+]
+for p in [1000, 925, 850, 700, 500, 400, 300, 250]:
+    FIELDS_TO_COMPARE += [
+        f"{p}_height_m", f"{p}_temp_C", f"{p}_dewpt_dep_C",
+        f"{p}_wind_dir_deg", f"{p}_wind_spd_kt"
+    ]
+
+# Field-specific thresholds
+FIELD_THRESHOLDS = {
+    'latitude': 0.2,
+    'longitude': 0.2,
+    'surface_temp_C': 1,
+    'surface_dewpt_dep_C': 1,
+    'surface_wind_dir_deg': 5,
+    'surface_wind_spd_kt': 2.7,
+}
+for p in [1000, 925, 850, 700, 500, 400, 300, 250]:
+    FIELD_THRESHOLDS.update({
+        f"{p}_height_m": 20,
+        f"{p}_temp_C": 1,
+        f"{p}_dewpt_dep_C": 1,
+        f"{p}_wind_dir_deg": 5,
+        f"{p}_wind_spd_kt": 2.7,
+    })
+
 def load_csv_data(csv_file):
+    with compressed_io.open_text(csv_file, newline='') as f:
+        return index_rows(csv.DictReader(f))
+
+def index_rows(rows):
     data = defaultdict(dict)
-    with open(csv_file, newline='') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            filename = row['filename']
-            drop_time = row['drop_time']
-            if filename.startswith("AR2025"):
-                key = ("ACS", drop_time)
-            elif filename.startswith("D"):
-                key = ("AVAPS", drop_time)
-            else:
-                continue
-            data[key] = row
+    for row in rows:
+        filename = row['filename']
+        drop_time = row['drop_time']
+        if filename.startswith("AR2025"):
+            key = ("ACS", drop_time)
+        elif filename.startswith("D"):
+            key = ("AVAPS", drop_time)
+        else:
+            continue
+        data[key] = row
     return data
 
+def rows_from_records(records):
+    # Decoded records as they would read back from decoded_xxaa.csv (blank for None, str() otherwise),
+    # so in-memory comparisons match the CSV round-trip exactly
+    for record in records:
+        yield {k: ('' if v is None else str(v)) for k, v in record.items()}
+
 def compare_rows(acs_row, avaps_row, fields, thresholds):
     diffs = []
     tolerated_diffs = 0
@@ -45,36 +85,47 @@ def compare_rows(acs_row, avaps_row, fields, thresholds):
                 exceed_diffs += 1
     return diffs, tolerated_diffs, exceed_diffs
 
-def main(csv_file):
-    data = load_csv_data(csv_file)
+def worst_exceedance(diffs, thresholds):
+    # ((diff / tolerance, field, diff) of the numeric difference furthest over its tolerance, or None,
+    #  [(field, diff)] of exceeded numeric fields that have no tolerance, e.g. marsden or units).
+    # Fields without a tolerance are listed apart: any difference in them would otherwise
+    # outrank every real exceedance.
+    worst = None
+    untoleranced = []
+    for field, a, b, diff, tolerated in diffs:
+        if tolerated or diff is None:
+            continue
+        threshold = thresholds.get(field, 0)
+        if not threshold:
+            untoleranced.append((field, diff))
+            continue
+        ratio = diff / threshold
+        if worst is None or ratio > worst[0]:
+            worst = (ratio, field, diff)
+    return worst, untoleranced
+
+def format_worst(exceedance):
+    worst, untoleranced = exceedance
+    parts = []
+    if worst is not None:
+        ratio, field, diff = worst
+        parts.append(f", worst {field} diff={diff:.2f} ({ratio:.1f}x tolerance)")
+    if untoleranced:
+        fields = ", ".join(f"{field} diff={diff:.2f}" for field, diff in untoleranced)
+        parts.append(f"; also differs without tolerance: {fields}" if parts else f", differs without tolerance: {fields}")
+    return "".join(parts) or " (non-numeric differences only)"
+
+def main(csv_file, catalog=None, compression=None):
+    with profiling.stage("load_csv") as st:
+        data = load_csv_data(csv_file)
+        st.bytes_read += os.path.getsize(csv_file)
+        st.samples += len(data)
+    write_comparison_report(data, catalog=catalog, compression=compression)
+
+def write_comparison_report(data, report_path="csv_comparison_report.txt", catalog=None, compression=None):
     matched_times = set(k[1] for k in data.keys() if k[0] == "ACS")
-    fields_to_compare = [
-        'latitude', 'longitude', 'marsden', 'units',
-        'surface_temp_C', 'surface_dewpt_dep_C', 'surface_wind_dir_deg', 'surface_wind_spd_kt'
-    ]
-    for p in [1000, 925, 850, 700, 500, 400, 300, 250]:
-        fields_to_compare += [
-            f"{p}_height_m", f"{p}_temp_C", f"{p}_dewpt_dep_C",
-            f"{p}_wind_dir_deg", f"{p}_wind_spd_kt"
-        ]
-
-    # Define field-specific thresholds
-    thresholds = {
-        'latitude': 0.2,
-        'longitude': 0.2,
-        'surface_temp_C': 1,
-        'surface_dewpt_dep_C': 1,
-        'surface_wind_dir_deg': 5,
-        'surface_wind_spd_kt': 2.7,
-    }
-    for p in [1000, 925, 850, 700, 500, 400, 300, 250]:
-        thresholds.update({
-            f"{p}_height_m": 20,
-            f"{p}_temp_C": 1,
-            f"{p}_dewpt_dep_C": 1,
-            f"{p}_wind_dir_deg": 5,
-            f"{p}_wind_spd_kt": 2.7,
-        })
+    fields_to_compare = FIELDS_TO_COMPARE
+    thresholds = FIELD_THRESHOLDS
 
     total = 0
     matched = 0
@@ -82,19 +133,25 @@ def main(csv_file):
     had_exceedances = 0
     exceeded_drops = []
 
-    with open("csv_comparison_report.txt", "w") as out:
+    report_path = compressed_io.with_compression(report_path, compression)
+    with compressed_io.open_text(report_path, "w") as out:
         for drop_time in matched_times:
             acs_key = ("ACS", drop_time)
             avaps_key = ("AVAPS", drop_time)
             total += 1
             if acs_key in data and avaps_key in data:
                 matched += 1
-                diffs, tolerated_diffs, exceed_diffs = compare_rows(data[acs_key], data[avaps_key], fields_to_compare, thresholds)
+                with profiling.stage("compare", file=drop_time) as st:
+                    diffs, tolerated_diffs, exceed_diffs = compare_rows(data[acs_key], data[avaps_key], fields_to_compare, thresholds)
+                    st.samples += len(fields_to_compare)
                 if exceed_diffs == 0:
                     all_within_tolerance += 1
                 else:
                     had_exceedances += 1
-                    exceeded_drops.append(drop_time)
+                    exceeded_drops.append((drop_time, exceed_diffs, worst_exceedance(diffs, thresholds)))
+                if catalog is not None:
+                    catalog.record_xxaa_comparison(drop_time, data[acs_key]['filename'], data[avaps_key]['filename'],
+                                                   diffs, tolerated_diffs, exceed_diffs)
 
                 out.write(f"Comparing drop_time {drop_time} (ACS: {data[acs_key]['filename']} vs AVAPS: {data[avaps_key]['filename']}):\n")
                 if diffs:
@@ -112,13 +169,20 @@ def main(csv_file):
         out.write(f"         {had_exceedances} file pairs had one or more differences that exceeded tolerances.\n")
         if exceeded_drops:
             out.write("\nList of drop_times with exceeded tolerances (sorted):\n")
-            for drop in sorted(exceeded_drops):
-                out.write(f"  {drop}\n")
+            for drop, count, worst in sorted(exceeded_drops):
+                out.write(f"  {drop}  {count} field(s) exceeded{format_worst(worst)}\n")
 
-    print("Comparison complete. See 'csv_comparison_report.txt'.")
+    print(f"Comparison complete. See '{report_path}'.")
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python compare_csv_data.py <decoded_csv_file>")
-    else:
-        main(sys.argv[1])
+    parser = argparse.ArgumentParser(description="Compare decoded ACS and AVAPS XXAA values from a decoded CSV file.")
+    parser.add_argument("csv_file", help="Decoded CSV file written by decode_xxaa_directory.py")
+    compressed_io.add_arguments(parser)
+    catalog.add_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+
+    profiling.start_from_args(args, "compare_acs_avaps_csv")
+    with catalog.open_from_args(args) as cat:
+        main(args.csv_file, cat, args.compress)
+    profiling.finish_from_args(args)
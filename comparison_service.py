@@ -0,0 +1,396 @@
+import argparse
+import io
+import json
+import math
+import os
+import re
+import socketserver
+import threading
+import time
+import traceback
+from collections import OrderedDict, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import acs_avaps_compare
+import campaign_pipeline
+import compare_acs_avaps_csv
+import csv_process
+import decode_xxaa_directory
+import resample
+
+
+# Long-lived local service for one campaign directory, so dashboards asking for the same
+# comparisons over and over don't pay for a Python start-up, the netCDF4 import and a
+# re-parse of the files on every request. Parsed soundings, comparison tables and decoded
+# XXAA blocks are kept in a bounded LRU cache keyed by file path, mtime and size, so a
+# rewritten file is simply a cache miss. Standard library only; nothing leaves the machine.
+#
+# GET endpoints (JSON unless noted):
+#   /drops[?flight=F][&rescan=1]      drops in the campaign and their input files
+#   /compare?drop=YYYYMMDD_HHMMSS     per-variable difference statistics for one drop
+#            [&format=csv]            ... or the per-drop comparison CSV itself
+#   /stats?flight=F[&format=text]     per-drop and flight-wide statistics (text = csv_process report)
+#   /compare and /stats also take &hz=N to compare on a common N Hz grid (see resample.py)
+#   /xxaa?drop=YYYYMMDD_HHMMSS        decoded ACS/AVAPS XXAA messages and their differences
+#   /status                           cache and index counters
+
+FLIGHT_RE = re.compile(r'-(\d{8}[A-Z]\d+)-')
+
+
+class NotFound(Exception):
+    # A drop, flight or drop pair that doesn't exist in the campaign (HTTP 404)
+    pass
+
+
+class BadRequest(Exception):
+    # Missing or invalid query parameters (HTTP 400)
+    pass
+
+
+def flight_of(netcdf_file, launch_time):
+    # AR2025-20250223N1-01-20250223T203707-5.nc -> 20250223N1; launch date if the name has no flight ID
+    match = FLIGHT_RE.search(os.path.basename(netcdf_file))
+    return match.group(1) if match else launch_time[:8]
+
+
+def file_key(path):
+    st = os.stat(path)
+    return (path, st.st_mtime_ns, st.st_size)
+
+
+class LRUCache:
+    # Evicts least recently used entries once the summed entry sizes exceed max_bytes
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.nbytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+
+class Drop:
+    __slots__ = ("launch_time", "flight", "netcdf_file", "d_file", "wmo_files")
+
+    def __init__(self, launch_time, flight, netcdf_file, d_file):
+        self.launch_time = launch_time
+        self.flight = flight
+        self.netcdf_file = netcdf_file
+        self.d_file = d_file
+        self.wmo_files = []
+
+    def as_dict(self):
+        return {"launch_time": self.launch_time, "flight": self.flight, "netcdf_file": self.netcdf_file,
+                "d_file": self.d_file, "wmo_files": self.wmo_files}
+
+
+class ComparisonService:
+    def __init__(self, directory, cache_mb=256, rescan_s=30.0, max_gap_s=2.0):
+        self.directory = directory
+        self.rescan_s = rescan_s
+        self.max_gap_s = max_gap_s
+        self.cache = LRUCache(int(cache_mb * 1024 * 1024))
+        self._drops = None
+        self._scanned_at = 0.0
+        self._index_lock = threading.Lock()
+        # netCDF4/HDF5 calls must not run concurrently, whichever request thread makes them
+        self._netcdf_lock = threading.Lock()
+
+    # Directory index
+
+    def drops(self, rescan=False):
+        with self._index_lock:
+            if rescan or self._drops is None or time.monotonic() - self._scanned_at > self.rescan_s:
+                self._drops = self._scan()
+                self._scanned_at = time.monotonic()
+            return self._drops
+
+    def _scan(self):
+        files = campaign_pipeline.discover(self.directory)
+        d_index = acs_avaps_compare.index_d_files(files.d_files)
+        drops = {}
+        for nc_file in files.netcdf_files:
+            launch_time = acs_avaps_compare.extract_launch_time(os.path.basename(nc_file))
+            d_file = acs_avaps_compare.lookup_d_file(d_index, os.path.dirname(nc_file), launch_time)
+            drops[launch_time] = Drop(launch_time, flight_of(nc_file, launch_time), nc_file, d_file)
+        for wmo_file in files.wmo_files:
+            drop = drops.get(decode_xxaa_directory.extract_drop_time(os.path.basename(wmo_file)))
+            if drop is not None:
+                drop.wmo_files.append(wmo_file)
+        return drops
+
+    def drop(self, launch_time):
+        drop = self.drops().get(launch_time)
+        if drop is None:
+            # may have arrived since the last scan
+            drop = self.drops(rescan=True).get(launch_time)
+        if drop is None:
+            raise NotFound(f"No drop {launch_time} in {self.directory}")
+        return drop
+
+    def flight_drops(self, flight):
+        return [drop for launch_time, drop in sorted(self.drops().items())
+                if drop.flight == flight or launch_time.startswith(flight)]
+
+    # Cached parsing
+
+    def _cached(self, key, load, size_of):
+        value = self.cache.get(key)
+        if value is None:
+            value = load()
+            self.cache.put(key, value, size_of(value))
+        return value
+
+    def acs_sounding(self, netcdf_file):
+        def load():
+            with self._netcdf_lock:
+                return acs_avaps_compare.read_acs_sounding(netcdf_file)
+        return self._cached(("acs",) + file_key(netcdf_file), load, lambda s: s.nbytes)
+
+    def avaps_sounding(self, d_file, launch_time):
+        return self._cached(("avaps", launch_time) + file_key(d_file),
+                            lambda: acs_avaps_compare.read_avaps_sounding(d_file, launch_time), lambda s: s.nbytes)
+
+    def comparison(self, drop, hz=None):
+        # hz: compare on a common uniform grid at this rate (see resample) instead of identical timetags
+        if drop.d_file is None:
+            raise NotFound(f"No D file found for drop {drop.launch_time}")
+        grid = resample.Grid(hz, self.max_gap_s) if hz else None
+        key = ("table", hz) + file_key(drop.netcdf_file) + file_key(drop.d_file)
+        return self._cached(key, lambda: acs_avaps_compare.compare_soundings(
+            self.acs_sounding(drop.netcdf_file), self.avaps_sounding(drop.d_file, drop.launch_time), drop.launch_time,
+            grid), lambda t: t.nbytes)
+
+    def decoded_xxaa(self, wmo_file):
+        def load():
+            name = os.path.basename(wmo_file)
+            return decode_xxaa_directory.decode_file_block(name, decode_xxaa_directory.extract_xxaa_block(wmo_file))
+        # decoded records are small dicts; a nominal size keeps them from crowding out soundings
+        return self._cached(("xxaa",) + file_key(wmo_file), lambda: load() or {}, lambda r: 4096)
+
+    # Queries
+
+    def compare_drop(self, launch_time, hz=None):
+        drop = self.drop(launch_time)
+        table = self.comparison(drop, hz)
+        stats = {}
+        for column, values in csv_process.table_difference_columns(table).items():
+            stats[column] = csv_process.column_stats(values, csv_process.THRESHOLDS[column]) if values else None
+        return dict(drop.as_dict(), points=len(table), stats=stats)
+
+    def comparison_csv(self, launch_time, hz=None):
+        out = io.StringIO()
+        acs_avaps_compare.write_comparison_rows(out, self.comparison(self.drop(launch_time), hz))
+        return out.getvalue()
+
+    def flight_stats(self, flight, hz=None):
+        drops = [drop for drop in self.flight_drops(flight) if drop.d_file is not None]
+        if not drops:
+            raise NotFound(f"No paired drops for flight {flight}")
+        global_data = defaultdict(list)
+        summary_output = []
+        per_drop = {}
+        for drop in drops:
+            columns = csv_process.table_difference_columns(self.comparison(drop, hz))
+            summary_output.append(csv_process.summarize_columns(f"{drop.launch_time}.csv", columns, global_data))
+            per_drop[drop.launch_time] = {
+                column: csv_process.column_stats(values, csv_process.THRESHOLDS[column]) if values else None
+                for column, values in columns.items()}
+        overall = {column: csv_process.column_stats(global_data[column], threshold) if global_data[column] else None
+                   for column, threshold in csv_process.THRESHOLDS.items()}
+        report = "".join(summary_output) + csv_process.write_global_summary(global_data, len(drops))
+        return {"flight": flight, "drops": per_drop, "global": overall}, report
+
+    def xxaa(self, launch_time):
+        drop = self.drop(launch_time)
+        records = [self.decoded_xxaa(path) for path in drop.wmo_files]
+        data = compare_acs_avaps_csv.index_rows(compare_acs_avaps_csv.rows_from_records(r for r in records if r))
+        result = {"drop": launch_time, "acs": data.get(("ACS", launch_time)),
+                  "avaps": data.get(("AVAPS", launch_time)), "differences": None}
+        if result["acs"] and result["avaps"]:
+            diffs, tolerated, exceeded = compare_acs_avaps_csv.compare_rows(
+                result["acs"], result["avaps"], compare_acs_avaps_csv.FIELDS_TO_COMPARE,
+                compare_acs_avaps_csv.FIELD_THRESHOLDS)
+            result["differences"] = [
+                {"field": field, "acs": a, "avaps": b, "diff": diff, "tolerated": ok}
+                for field, a, b, diff, ok in diffs if a != b]
+            result["tolerated"] = tolerated
+            result["exceeded"] = exceeded
+        return result
+
+    def status(self):
+        drops = self.drops()
+        return {"directory": self.directory, "drops": len(drops),
+                "paired": sum(1 for d in drops.values() if d.d_file is not None),
+                "index_age_s": round(time.monotonic() - self._scanned_at, 1), "cache": self.cache.stats()}
+
+
+def _json_safe(value):
+    # NaN/inf are not valid JSON; send null instead
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    return value
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    service = None  # set by make_server
+    quiet = False
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            if url.path == "/drops":
+                drops = self.service.drops(rescan=params.get("rescan") == "1")
+                flight = params.get("flight")
+                selected = self.service.flight_drops(flight) if flight else [drops[k] for k in sorted(drops)]
+                self._send_json([d.as_dict() for d in selected])
+            elif url.path == "/compare":
+                drop = self._required(params, "drop")
+                hz = self._hz(params)
+                if params.get("format") == "csv":
+                    self._send(200, self.service.comparison_csv(drop, hz), "text/csv")
+                else:
+                    self._send_json(self.service.compare_drop(drop, hz))
+            elif url.path == "/stats":
+                stats, report = self.service.flight_stats(self._required(params, "flight"), self._hz(params))
+                if params.get("format") == "text":
+                    self._send(200, report, "text/plain")
+                else:
+                    self._send_json(stats)
+            elif url.path == "/xxaa":
+                self._send_json(self.service.xxaa(self._required(params, "drop")))
+            elif url.path == "/status":
+                self._send_json(self.service.status())
+            else:
+                self._send_json({"error": f"Unknown endpoint {url.path}"}, 404)
+        except BadRequest as e:
+            self._send_json({"error": str(e)}, 400)
+        except NotFound as e:
+            self._send_json({"error": str(e)}, 404)
+        except OSError as e:
+            self._send_json({"error": f"Could not read input: {e}"}, 500)
+        except Exception as e:
+            # e.g. a malformed NetCDF or D file; answer instead of dropping the connection
+            self.log_error("%s failed: %s", self.path, traceback.format_exc())
+            self._send_json({"error": f"{type(e).__name__}: {e}"}, 500)
+
+    def _hz(self, params):
+        if not params.get("hz"):
+            return None
+        try:
+            hz = float(params["hz"])
+        except ValueError:
+            raise BadRequest(f"'hz' must be a number, not {params['hz']!r}") from None
+        if not hz > 0:
+            raise BadRequest("'hz' must be positive")
+        return hz
+
+    def _required(self, params, name):
+        if not params.get(name):
+            raise BadRequest(f"Missing '{name}' parameter")
+        return params[name]
+
+    def _send_json(self, value, code=200):
+        self._send(code, json.dumps(_json_safe(value), indent=1) + "\n", "application/json")
+
+    def _send(self, code, text, content_type):
+        body = text.encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket peers have no (host, port) address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "local"
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service, host="127.0.0.1", port=8765, socket_path=None, quiet=False):
+    handler = type("Handler", (RequestHandler,), {"service": service, "quiet": quiet})
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        return UnixHTTPServer(socket_path, handler)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve ACS/AVAPS drop comparisons for a campaign directory from a warm in-memory cache "
+                    "(e.g. curl 'http://127.0.0.1:8765/compare?drop=20250223_203707').")
+    parser.add_argument("directory", help="Campaign directory (.nc, D files and .WMO messages)")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="TCP port (default: 8765)")
+    parser.add_argument("--socket", metavar="PATH", default=None,
+                        help="Listen on this Unix socket instead of TCP (curl --unix-socket PATH ...)")
+    parser.add_argument("--cache-mb", type=float, default=256,
+                        help="Memory budget for cached soundings and comparisons (default: 256)")
+    parser.add_argument("--rescan", type=float, default=30, metavar="SECONDS",
+                        help="Re-index the directory when the index is older than this (default: 30)")
+    parser.add_argument("--max-gap", type=float, default=2.0, metavar="SECONDS",
+                        help="For hz= queries, don't interpolate across gaps longer than this (default: 2)")
+    parser.add_argument("--quiet", action="store_true", help="Don't log each request")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        print(f"Error: {args.directory} is not a valid directory.")
+        return
+
+    service = ComparisonService(args.directory, args.cache_mb, args.rescan, args.max_gap)
+    server = make_server(service, args.host, args.port, args.socket, args.quiet)
+    drops = service.drops()
+    print(f"Indexed {len(drops)} drops in {args.directory}.")
+    print(f"Serving on {args.socket if args.socket else f'http://{args.host}:{args.port}'} (Ctrl-C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
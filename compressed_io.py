@@ -0,0 +1,90 @@
+import gzip
+import io
+import os
+from glob import glob
+
+
+# Text files that may be gzip (.gz) or zstd (.zst) compressed, picked by file extension.
+# Compression happens while streaming, so writers never hold the whole file in memory
+# and there is no separate compression pass.
+
+COMPRESSION_SUFFIXES = {
+    "gzip": ".gz",
+    "zstd": ".zst",
+}
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("zstd compression needs the 'zstandard' package (pip install zstandard)") from None
+    return zstandard
+
+
+def compression_of(path):
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if path.endswith(suffix):
+            return compression
+    return None
+
+
+def with_compression(path, compression):
+    # "processed/x.csv", "gzip" -> "processed/x.csv.gz"
+    if not compression or compression == "none":
+        return path
+    return path + COMPRESSION_SUFFIXES[compression]
+
+
+def strip_compression(path):
+    compression = compression_of(path)
+    return path[:-len(COMPRESSION_SUFFIXES[compression])] if compression else path
+
+
+def open_text(path, mode="r", newline=None, encoding=None):
+    # Like open() for text modes "r"/"w", compressing/decompressing by extension
+    compression = compression_of(path)
+    if compression is None:
+        return open(path, mode, newline=newline, encoding=encoding)
+    if compression == "gzip":
+        # level 6 is the usual speed/size compromise; 9 is several times slower for a few % more
+        return gzip.open(path, mode + "t", compresslevel=6, newline=newline, encoding=encoding)
+
+    zstandard = _zstandard()
+    raw = open(path, mode + "b")
+    try:
+        if mode == "r":
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        else:
+            stream = zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=True)
+    except Exception:
+        raw.close()
+        raise
+    return io.TextIOWrapper(stream, newline=newline, encoding=encoding)
+
+
+def csv_patterns(stem="*"):
+    # glob patterns matching plain and compressed CSV files
+    return [f"{stem}.csv"] + [f"{stem}.csv{suffix}" for suffix in COMPRESSION_SUFFIXES.values()]
+
+
+def find_csv_files(directory, stem="*"):
+    # Sorted CSV files in directory, one per CSV: when one was written both plain and compressed
+    # (e.g. a directory re-run with --compress), only the most recently written variant is used
+    variants = {}
+    for pattern in csv_patterns(stem):
+        for path in glob(os.path.join(directory, pattern)):
+            variants.setdefault(strip_compression(path), []).append(path)
+    csv_files = []
+    for paths in variants.values():
+        newest = max(paths, key=os.path.getmtime)
+        if len(paths) > 1:
+            print(f"Warning: {len(paths)} variants of {os.path.basename(strip_compression(newest))}; "
+                  f"using {os.path.basename(newest)}")
+        csv_files.append(newest)
+    return sorted(csv_files)
+
+
+def add_arguments(parser):
+    parser.add_argument("--compress", choices=["none"] + list(COMPRESSION_SUFFIXES), default="none",
+                        help="Compress CSV and report outputs while writing them (default: none)")
@@ -0,0 +1 @@
+# Lets a plain `pytest` run import the top-level scripts, as `python -m pytest` does
@@ -1,8 +1,13 @@
-import pandas as pd
 import argparse
+import csv
+import math
 import os
-from glob import glob
 from collections import defaultdict
+import catalog
+import compressed_io
+import drop_bootstrap
+import job_scheduler
+import profiling
 
 # Thresholds for differences
 THRESHOLDS = {
@@ -15,88 +20,198 @@ THRESHOLDS = {
     'AVAPS - ACS V': 1.0                 # m/s (North-South)
 }
 
-def analyze_file(csv_path, global_data):
-    df = pd.read_csv(csv_path)
-    summary_lines = [f"\n=== File: {os.path.basename(csv_path)} ===\n"]
+# Only summary statistics are needed here, so this module sticks to the standard library
+# (no pandas import on startup).
+
+def variable_name(column):
+    # 'AVAPS - ACS Temperature' -> 'Temperature'
+    return column.replace("AVAPS - ACS ", "")
+
+def drop_name(csv_path):
+    # 'processed/20250223_203707.csv.gz' -> '20250223_203707', the key acs_avaps_compare profiles a drop under
+    return os.path.basename(compressed_io.strip_compression(csv_path))[:-len(".csv")]
+
+def parse_number(text):
+    # Blank or non-numeric fields count as missing, like pd.to_numeric(errors='coerce')
+    try:
+        value = float(text)
+    except ValueError:
+        return None
+    return value if value == value else None
+
+def read_difference_columns(csv_path):
+    # Returns ({column: [valid values]} for the THRESHOLDS columns present, number of data rows)
+    with compressed_io.open_text(csv_path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        indexes = {column: header.index(column) for column in THRESHOLDS if column in header}
+        columns = {column: [] for column in indexes}
+        rows = 0
+        for row in reader:
+            rows += 1
+            for column, i in indexes.items():
+                if i < len(row):
+                    value = parse_number(row[i])
+                    if value is not None:
+                        columns[column].append(value)
+    return columns, rows
+
+def read_csv_file(csv_path):
+    with profiling.stage("read_csv", file=drop_name(csv_path)) as st:
+        columns, rows = read_difference_columns(csv_path)
+        st.bytes_read += os.path.getsize(csv_path)
+        st.samples += rows
+    return columns, rows
+
+def analyze_file(csv_path, global_data, catalog=None, bootstrap=None, columns_rows=None):
+    # columns_rows: read_csv_file(csv_path) when it was already read (by a scheduler worker)
+    name = os.path.basename(csv_path)
+    columns, rows = columns_rows or read_csv_file(csv_path)
+
+    with profiling.stage("summarize", file=drop_name(name)) as st:
+        st.samples += rows
+        return summarize_columns(name, columns, global_data, catalog, bootstrap)
+
+def analyze_table(name, table, global_data, catalog=None, bootstrap=None):
+    # Same as analyze_file for a comparison table already in memory (from acs_avaps_compare.compare_data)
+    with profiling.stage("summarize", file=drop_name(name)) as st:
+        st.samples += len(table)
+        return summarize_columns(name, table_difference_columns(table), global_data, catalog, bootstrap)
+
+def table_difference_columns(table):
+    # {column: [valid values]} for the THRESHOLDS columns of an in-memory comparison table
+    columns = {}
+    for column in THRESHOLDS:
+        if column in table:
+            values = table[column]
+            columns[column] = values[values == values].tolist()  # drop NaN
+    return columns
+
+def column_stats(values, threshold):
+    # values: non-empty list of valid (non-NaN) differences
+    total = len(values)
+    mean = math.fsum(values) / total
+    # sample standard deviation (ddof=1), NaN for a single value
+    std = math.sqrt(math.fsum((v - mean) ** 2 for v in values) / (total - 1)) if total > 1 else float('nan')
+    within_threshold = sum(1 for v in values if abs(v) <= threshold)
+    return {
+        'total': total,
+        'mean': mean,
+        'min': min(values),
+        'max': max(values),
+        'std': std,
+        'within_threshold': within_threshold,
+        'pct_within': 100 * within_threshold / total,
+    }
+
+def format_stats(column, stats, extra_lines=()):
+    return [
+        f"{column}:\n",
+        f"  Total values        : {stats['total']}\n",
+        f"  Mean difference     : {stats['mean']:.4f}\n",
+        f"  Min/Max difference  : {stats['min']:.4f} / {stats['max']:.4f}\n",
+        f"  Std dev             : {stats['std']:.4f}\n",
+        f"  Within threshold    : {stats['within_threshold']} ({stats['pct_within']:.1f}%)\n",
+        *extra_lines,
+        "\n",
+    ]
+
+def summarize_columns(name, columns, global_data, catalog=None, bootstrap=None):
+    summary_lines = [f"\n=== File: {name} ===\n"]
 
     for column, threshold in THRESHOLDS.items():
-        if column not in df.columns:
+        if column not in columns:
             summary_lines.append(f"{column}: Column missing.\n")
             continue
 
-        values = pd.to_numeric(df[column], errors='coerce').dropna()
+        values = columns[column]
         total = len(values)
 
         if total == 0:
             summary_lines.append(f"{column}: No valid data.\n")
             continue
 
-        global_data[column].extend(values.tolist())  # accumulate globally
+        global_data[column].extend(values)  # accumulate globally
 
-        within_threshold = (values.abs() <= threshold).sum()
-        pct_within = 100 * within_threshold / total
-
-        summary_lines.append(f"{column}:\n")
-        summary_lines.append(f"  Total values        : {total}\n")
-        summary_lines.append(f"  Mean difference     : {values.mean():.4f}\n")
-        summary_lines.append(f"  Min/Max difference  : {values.min():.4f} / {values.max():.4f}\n")
-        summary_lines.append(f"  Std dev             : {values.std():.4f}\n")
-        summary_lines.append(f"  Within threshold    : {within_threshold} ({pct_within:.1f}%)\n\n")
+        stats = column_stats(values, threshold)
+        summary_lines.extend(format_stats(column, stats))
+        if catalog is not None:
+            catalog.record_variable_stats(name, variable_name(column), stats, threshold)
+        if bootstrap is not None:
+            bootstrap.add(name, column, stats)
 
     return "".join(summary_lines)
 
-def write_global_summary(global_data, file_count):
+def write_global_summary(global_data, file_count, bootstrap=None):
     lines = [f"\n=== GLOBAL SUMMARY ACROSS {file_count} FILE(S) ===\n"]
 
     for column, threshold in THRESHOLDS.items():
-        values = pd.to_numeric(global_data[column], errors='coerce')
-        values = pd.Series(values).dropna()
+        values = global_data[column]
         total = len(values)
 
         if total == 0:
             lines.append(f"{column}: No valid data.\n")
             continue
 
-        within_threshold = (values.abs() <= threshold).sum()
-        pct_within = 100 * within_threshold / total
-
-        lines.append(f"{column}:\n")
-        lines.append(f"  Total values        : {total}\n")
-        lines.append(f"  Mean difference     : {values.mean():.4f}\n")
-        lines.append(f"  Min/Max difference  : {values.min():.4f} / {values.max():.4f}\n")
-        lines.append(f"  Std dev             : {values.std():.4f}\n")
-        lines.append(f"  Within threshold    : {within_threshold} ({pct_within:.1f}%)\n\n")
+        extra_lines = bootstrap.format_lines(column) if bootstrap is not None else ()
+        lines.extend(format_stats(column, column_stats(values, threshold), extra_lines))
 
     return "".join(lines)
 
-def process_directory(directory):
-    csv_files = sorted(glob(os.path.join(directory, "*.csv")))
+def process_directory(directory, catalog=None, compression=None, bootstrap=None, scheduler=None):
+    with profiling.stage("scan_directory") as st:
+        csv_files = compressed_io.find_csv_files(directory)
+        st.samples += len(csv_files)
     if not csv_files:
         print(f"No CSV files found in: {directory}")
         return
 
     global_data = defaultdict(list)
-    summary_output = []
 
-    for i, csv_file in enumerate(csv_files, start=1):
+    # With a scheduler the files are read and parsed by worker processes, largest first, and each
+    # one is summarized as soon as it arrives, so parsed values are never held twice. Only the
+    # per-file summary texts wait to be put back in file order.
+    if scheduler is None:
+        read_files = ((csv_file, None) for csv_file in csv_files)
+    else:
+        jobs = [(csv_file, (csv_file,), os.path.getsize(csv_file)) for csv_file in csv_files]
+        read_files = scheduler.run(read_csv_file, jobs)
+
+    summaries = {}
+    for i, (csv_file, columns_rows) in enumerate(read_files, start=1):
         print(f"Processing file {i} of {len(csv_files)}: {os.path.basename(csv_file)}")
-        file_summary = analyze_file(csv_file, global_data)
-        summary_output.append(file_summary)
+        summaries[csv_file] = analyze_file(csv_file, global_data, catalog, bootstrap, columns_rows)
+    summary_output = [summaries[csv_file] for csv_file in csv_files]
+
+    write_summary_report(directory, summary_output, global_data, len(csv_files), compression, bootstrap)
 
+def write_summary_report(directory, summary_output, global_data, file_count, compression=None, bootstrap=None):
     # Add global summary
-    global_summary = write_global_summary(global_data, len(csv_files))
-    summary_output.append(global_summary)
+    with profiling.stage("global_summary") as st:
+        st.samples += sum(len(v) for v in global_data.values())
+        global_summary = write_global_summary(global_data, file_count, bootstrap)
 
     # Write to file
-    summary_path = os.path.join(directory, "avaps_acs_summary.txt")
-    with open(summary_path, "w") as f:
-        f.writelines(summary_output)
+    summary_path = compressed_io.with_compression(os.path.join(directory, "avaps_acs_summary.txt"), compression)
+    with profiling.stage("write_report"):
+        with compressed_io.open_text(summary_path, "w") as f:
+            f.writelines(summary_output)
+            f.write(global_summary)
 
     print(f"Summary written to: {summary_path}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Process AVAPS vs ACS CSV files in a directory and write summary.")
     parser.add_argument("directory", help="Path to the directory containing CSV files")
+    compressed_io.add_arguments(parser)
+    drop_bootstrap.add_arguments(parser)
+    job_scheduler.add_arguments(parser)
+    catalog.add_arguments(parser)
+    profiling.add_arguments(parser)
     args = parser.parse_args()
 
-    process_directory(args.directory)
+    profiling.start_from_args(args, "csv_process")
+    with catalog.open_from_args(args) as cat:
+        process_directory(args.directory, cat, args.compress, drop_bootstrap.from_args(args),
+                          job_scheduler.from_args(args, "csv_process"))
+    profiling.finish_from_args(args)
@@ -1,13 +1,19 @@
 import os
 import re
 import csv
-import sys
+import argparse
+import compressed_io
+import flight_archive
+import job_scheduler
+import profiling
 
 
 def extract_xxaa_block(file_path):
     with open(file_path, 'r') as f:
-        lines = f.readlines()
+        return xxaa_block(f.readlines())
 
+
+def xxaa_block(lines):
     block = []
     in_xxaa = False
 
@@ -39,11 +45,15 @@ def safe_float(s):
         return None
 
 
+# Mandatory pressure levels of TEMP Part A: level indicator -> hPa
+PRESSURE_MAP = {
+    "00": 1000, "92": 925, "85": 850, "70": 700,
+    "50": 500, "40": 400, "30": 300, "25": 250
+}
+
+
 def decode_group(group):
-    pressure_map = {
-        "00": 1000, "92": 925, "85": 850, "70": 700,
-        "50": 500, "40": 400, "30": 300, "25": 250
-    }
+    pressure_map = PRESSURE_MAP
     if len(group) != 5 or not group[:2].isdigit():
         return (None, None)
     code = group[:2]
@@ -137,10 +147,7 @@ def decode_xxaa_block(block):
             surface_pressure, surface_temp, surface_dew, surface_wind_dir, surface_wind_spd = surface_data
         groups = groups[3:]
 
-    pressure_map = {
-        "00": 1000, "92": 925, "85": 850, "70": 700,
-        "50": 500, "40": 400, "30": 300, "25": 250
-    }
+    pressure_map = PRESSURE_MAP
     levels = {v: {'height': None, 'temp': None, 'dewpt': None, 'wind_dir': None, 'wind_spd': None} for v in pressure_map.values()}
 
     for i in range(0, len(groups), 3):
@@ -187,52 +194,117 @@ def decode_xxaa_block(block):
     return result
 
 
-def decode_directory_to_csv(directory, output_csv="decoded_xxaa.csv"):
-    files = [f for f in os.listdir(directory) if f.endswith(".WMO")]
+def decode_directory_to_csv(directory, output_csv="decoded_xxaa.csv", compression=None, scheduler=None):
+    if flight_archive.is_archive(directory):
+        return decode_archive_to_csv(directory, output_csv, compression)
+    with profiling.stage("scan_directory") as st:
+        files = [f for f in os.listdir(directory) if f.endswith(".WMO")]
+        st.samples += len(files)
     total_files = len(files)
     print(f"Found {total_files} files for processing.")
-    records = []
     max_filename_len = max((len(f) for f in files), default=0)
 
-    for i, f in enumerate(files, 1):
+    if scheduler is None:
+        decoded_files = ((f, decode_wmo_file(directory, f)) for f in files)
+    else:
+        # largest files first over worker processes; records are put back in directory order below
+        jobs = [(f, (directory, f), os.path.getsize(os.path.join(directory, f))) for f in files]
+        decoded_files = scheduler.run(decode_wmo_file, jobs)
+    decoded_by_file = {}
+    for i, (f, decoded) in enumerate(decoded_files, 1):
         print(f"\rProcessing file {i} of {total_files}: {f.ljust(max_filename_len)}", end='', flush=True)
-        file_path = os.path.join(directory, f)
+        decoded_by_file[f] = decoded
+    records = [decoded_by_file[f] for f in files if decoded_by_file[f]]
+
+    print()
+    if not records:
+        print("No XXAA data decoded.")
+        return records
+
+    write_decoded_csv(records, output_csv, compression)
+    return records
+
+
+def decode_wmo_file(directory, f):
+    file_path = os.path.join(directory, f)
+    with profiling.stage("extract_xxaa", file=f) as st:
         block = extract_xxaa_block(file_path)
-        if not block:
-            continue
-        decoded = decode_xxaa_block(block)
+        st.bytes_read += os.path.getsize(file_path)
+        st.samples += len(block)
+    return decode_file_block(f, block)
+
+
+def decode_archive_to_csv(archive, output_csv="decoded_xxaa.csv", compression=None):
+    # Same as decode_directory_to_csv for the .WMO members of a flight archive, read in one pass
+    records = []
+    count = 0
+    for path, _, data in flight_archive.iter_members(archive, ("wmo",)):
+        f = os.path.basename(path)
+        count += 1
+        print(f"\rProcessing file {count}: {f}", end='', flush=True)
+        with profiling.stage("extract_xxaa", file=f) as st:
+            block = xxaa_block(flight_archive.text_lines(data))
+            st.bytes_read += len(data)
+            st.samples += len(block)
+        decoded = decode_file_block(f, block)
         if decoded:
-            decoded['filename'] = f
-            decoded['drop_time'] = extract_drop_time(f)
             records.append(decoded)
 
     print()
+    print(f"Processed {count} files from {archive}.")
     if not records:
         print("No XXAA data decoded.")
-        return
-
-    fieldnames = [
-        'filename', 'drop_time', 'day_of_month', 'hour_gmt', 'wind_indicator',
-        'latitude', 'longitude', 'marsden', 'units',
-        'surface_pressure_mb', 'surface_temp_C', 'surface_dewpt_dep_C',
-        'surface_wind_dir_deg', 'surface_wind_spd_kt'
-    ]
-    for p in sorted([1000, 925, 850, 700, 500, 400, 300, 250], reverse=True):
-        fieldnames.extend([
-            f"{p}_height_m", f"{p}_temp_C", f"{p}_dewpt_dep_C",
-            f"{p}_wind_dir_deg", f"{p}_wind_spd_kt"
-        ])
-
-    with open(output_csv, 'w', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(records)
+        return records
+
+    write_decoded_csv(records, output_csv, compression)
+    return records
+
+
+def decode_file_block(filename, block):
+    # Decode an extracted XXAA block and tag it with its file name and drop time
+    if not block:
+        return None
+    with profiling.stage("decode", file=filename):
+        decoded = decode_xxaa_block(block)
+    if decoded:
+        decoded['filename'] = filename
+        decoded['drop_time'] = extract_drop_time(filename)
+    return decoded
+
+
+FIELDNAMES = [
+    'filename', 'drop_time', 'day_of_month', 'hour_gmt', 'wind_indicator',
+    'latitude', 'longitude', 'marsden', 'units',
+    'surface_pressure_mb', 'surface_temp_C', 'surface_dewpt_dep_C',
+    'surface_wind_dir_deg', 'surface_wind_spd_kt'
+] + [
+    f"{p}_{field}"
+    for p in sorted([1000, 925, 850, 700, 500, 400, 300, 250], reverse=True)
+    for field in ("height_m", "temp_C", "dewpt_dep_C", "wind_dir_deg", "wind_spd_kt")
+]
+
+
+def write_decoded_csv(records, output_csv="decoded_xxaa.csv", compression=None):
+    output_csv = compressed_io.with_compression(output_csv, compression)
+    with profiling.stage("write_csv") as st:
+        with compressed_io.open_text(output_csv, 'w', newline='') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
+            writer.writeheader()
+            writer.writerows(records)
+        st.samples += len(records)
 
     print(f"Wrote {len(records)} lines to {output_csv}.")
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python decode_xxaa_directory.py <directory>")
-    else:
-        decode_directory_to_csv(sys.argv[1])
+    parser = argparse.ArgumentParser(description="Decode the XXAA part of every .WMO file in a directory to CSV.")
+    parser.add_argument("directory", help="Path to the directory containing .WMO files, or a .tar.gz/.zip flight archive")
+    compressed_io.add_arguments(parser)
+    job_scheduler.add_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+
+    profiling.start_from_args(args, "decode_xxaa_directory")
+    decode_directory_to_csv(args.directory, compression=args.compress,
+                            scheduler=job_scheduler.from_args(args, "decode_xxaa_directory"))
+    profiling.finish_from_args(args)
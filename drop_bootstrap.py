@@ -0,0 +1,90 @@
+from collections import defaultdict
+
+
+# Drop-level block bootstrap for the campaign-wide bias statistics of csv_process. Samples
+# within one drop are strongly autocorrelated, so resampling single samples would give far too
+# narrow intervals; whole drops are resampled instead. Each drop is reduced to partial sums
+# (valid count, sum of differences, count within threshold) as it is summarized, and a batch of
+# resamples is one (resamples, drops) matrix of drop indexes whose partial sums are gathered and
+# summed in a single NumPy reduction. The statistics are ratios of the resampled sums, weighting
+# each drop by its number of samples like the global summary does. Drops are resampled in name
+# order, so the intervals don't depend on the order files were summarized in. NumPy is only
+# imported once intervals are computed, so csv_process keeps its light startup.
+
+class DropBootstrap:
+    def __init__(self, resamples=2000, level=0.95, seed=0, batch_elements=1_000_000):
+        self.resamples = resamples
+        self.level = level
+        self.seed = seed
+        self.batch_elements = batch_elements
+        self.partials = defaultdict(dict)  # column -> {drop name: (count, sum, within threshold)}
+
+    def add(self, name, column, stats):
+        # stats: csv_process.column_stats of drop `name`'s valid values for column
+        self.partials[column][name] = (stats['total'], stats['mean'] * stats['total'], stats['within_threshold'])
+
+    def resampled(self, column):
+        # (mean difference, percentage within threshold) of every resample, or None for < 2 drops
+        import numpy as np
+
+        by_drop = self.partials.get(column, {})
+        partials = np.array([by_drop[name] for name in sorted(by_drop)], dtype=np.float64)
+        drops = len(partials)
+        if drops < 2:
+            return None
+        counts, sums, within = partials.T
+        rng = np.random.default_rng(self.seed)
+        means = np.empty(self.resamples)
+        pct_within = np.empty(self.resamples)
+        batch = max(1, self.batch_elements // drops)
+        for start in range(0, self.resamples, batch):
+            stop = min(start + batch, self.resamples)
+            idx = rng.integers(0, drops, size=(stop - start, drops))
+            n = counts[idx].sum(axis=1)
+            means[start:stop] = sums[idx].sum(axis=1) / n
+            pct_within[start:stop] = 100 * within[idx].sum(axis=1) / n
+        return means, pct_within
+
+    def intervals(self, column):
+        # Percentile intervals {"mean": (lo, hi), "pct_within": (lo, hi)}, or None for < 2 drops
+        import numpy as np
+
+        resampled = self.resampled(column)
+        if resampled is None:
+            return None
+        tail = (1 - self.level) / 2
+        means, pct_within = resampled
+        return {
+            "mean": tuple(np.quantile(means, [tail, 1 - tail]).tolist()),
+            "pct_within": tuple(np.quantile(pct_within, [tail, 1 - tail]).tolist()),
+        }
+
+    def format_lines(self, column):
+        drops = len(self.partials.get(column, ()))
+        ci = self.intervals(column)
+        if ci is None:
+            return [f"  Bootstrap CI        : needs at least 2 drops ({drops})\n"]
+        pct = f"{100 * self.level:g}%"
+        return [
+            f"  {'Mean diff ' + pct + ' CI':<20}: [{ci['mean'][0]:.4f}, {ci['mean'][1]:.4f}]\n",
+            f"  {'Within ' + pct + ' CI':<20}: [{ci['pct_within'][0]:.1f}%, {ci['pct_within'][1]:.1f}%]"
+            f" ({self.resamples} drop resamples of {drops} drops)\n",
+        ]
+
+
+def add_arguments(parser):
+    parser.add_argument("--bootstrap", type=int, default=0, metavar="N",
+                        help="Add drop-level bootstrap confidence intervals from N resamples to the global summary")
+    parser.add_argument("--bootstrap-level", type=float, default=0.95, metavar="LEVEL",
+                        help="Confidence level of the bootstrap intervals (default: 0.95)")
+    parser.add_argument("--bootstrap-seed", type=int, default=0,
+                        help="Random seed, so reports are reproducible (default: 0)")
+
+
+def from_args(args):
+    # None unless --bootstrap was given
+    if not args.bootstrap:
+        return None
+    if args.bootstrap < 0 or not 0 < args.bootstrap_level < 1:
+        raise SystemExit("--bootstrap must be positive and --bootstrap-level between 0 and 1")
+    return DropBootstrap(args.bootstrap, args.bootstrap_level, args.bootstrap_seed)
@@ -0,0 +1,54 @@
+import os
+import re
+import tarfile
+import zipfile
+
+
+# Flight bundles (.tar.gz, .zip, ...) read in place instead of being unpacked to disk first.
+# Members are streamed in archive order in a single sequential pass; tar archives are opened
+# in stream mode, so they are never seeked. Callers get each member's bytes and parse them from
+# memory. A member is named by os.path.join(archive, member name), so code that groups files by
+# os.path.dirname keeps working.
+
+ARCHIVE_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz", ".zip")
+
+D_FILE_RE = re.compile(r'D\d{8}_\d{6}\.')
+
+
+def is_archive(path):
+    return os.path.isfile(path) and path.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def member_kind(name):
+    # "netcdf", "wmo" or "dfile" for the members the comparison scripts read, else None
+    base = os.path.basename(name)
+    if base.endswith(".WMO"):
+        return "wmo"
+    if base.endswith(".nc"):
+        return "netcdf"
+    if D_FILE_RE.match(base):
+        return "dfile"
+    return None
+
+
+def iter_members(archive, kinds=("netcdf", "dfile", "wmo")):
+    # Yields (member path, kind, data bytes) for members of the wanted kinds, in archive order.
+    # Other members are skipped without being decompressed into memory.
+    if archive.lower().endswith(".zip"):
+        with zipfile.ZipFile(archive) as zf:
+            for info in zf.infolist():
+                kind = None if info.is_dir() else member_kind(info.filename)
+                if kind in kinds:
+                    yield os.path.join(archive, info.filename), kind, zf.read(info)
+        return
+
+    with tarfile.open(archive, "r|*") as tf:
+        for member in tf:
+            kind = member_kind(member.name) if member.isfile() else None
+            if kind in kinds:
+                yield os.path.join(archive, member.name), kind, tf.extractfile(member).read()
+
+
+def text_lines(data):
+    # Member bytes -> lines as open(path, 'r') would give them
+    return data.decode("utf-8", errors="replace").splitlines(keepends=True)
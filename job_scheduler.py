@@ -0,0 +1,202 @@
+import json
+import os
+
+import profiling
+
+
+# Memory-aware scheduling of per-file jobs over worker processes for the batch drivers
+# (acs_avaps_compare, decode_xxaa_directory, csv_process). Each job comes with a size in
+# "units" (input bytes, plus SAMPLE_BYTES per NetCDF sample where known). Jobs are dispatched
+# largest first, so one long sounding doesn't start last and leave the other workers idle, and
+# a job only starts when the estimated peak memory of the jobs in flight, plus its own, fits the
+# memory budget (a single job always runs). Each worker measures its peak RSS per job; the
+# (units, peak MB) observations are kept per tool in a JSON history file, and the memory model
+# (base + slope * units, plus the largest underestimate seen) is refitted from it on every run.
+
+SAMPLE_BYTES = 8 * 32           # roughly one float64 per NetCDF variable per sample
+DEFAULT_BASE_MB = 150.0         # worker interpreter with numpy/netCDF4 loaded
+DEFAULT_MB_PER_MB = 10.0        # in-memory arrays and tables per MB of input, before any history
+HISTORY_LIMIT = 500             # observations kept per tool
+
+
+def netcdf_samples(netcdf_file):
+    # Length of the GpsUtcTime dimension, read from the file header; None if it can't be read
+    from netCDF4 import Dataset
+
+    try:
+        with Dataset(netcdf_file, 'r') as dataset:
+            return len(dataset.groups['Profile'].variables['GpsUtcTime'])
+    except (KeyError, OSError):
+        return None
+
+
+def file_units(paths, netcdf_file=None):
+    units = sum(os.path.getsize(path) for path in paths if path)
+    if netcdf_file:
+        units += SAMPLE_BYTES * (netcdf_samples(netcdf_file) or 0)
+    return units
+
+
+def available_memory_mb():
+    # MemAvailable on Linux, else None (no cap)
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    # Linux: writing 5 to clear_refs resets the peak RSS (VmHWM) of this process
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb(reset):
+    if reset:
+        try:
+            with open("/proc/self/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+    # peak over the worker's lifetime: an overestimate for all but its largest job
+    return profiling.peak_rss_mb()
+
+
+def _run_job(tool, func, args):
+    # Runs in a worker process: func(*args), its peak RSS and its profiling.run_profiled report
+    reset = _reset_peak_rss()
+    result, report = profiling.run_profiled(tool, func, *args)
+    return result, _peak_rss_mb(reset), report
+
+
+class MemoryModel:
+    def __init__(self, observations=()):
+        self.observations = [tuple(o) for o in observations][-HISTORY_LIMIT:]
+        self.base, self.slope, self.margin = DEFAULT_BASE_MB, DEFAULT_MB_PER_MB / 2**20, 0.0
+        self.fit()
+
+    def fit(self):
+        # Least-squares line through the observations; too few distinct sizes keep the default slope
+        n = len(self.observations)
+        if not n:
+            return
+        mean_x = sum(x for x, _ in self.observations) / n
+        mean_y = sum(y for _, y in self.observations) / n
+        sxx = sum((x - mean_x) ** 2 for x, _ in self.observations)
+        if sxx > 0:
+            self.slope = max(0.0, sum((x - mean_x) * (y - mean_y) for x, y in self.observations) / sxx)
+        self.base = max(0.0, mean_y - self.slope * mean_x)
+        self.margin = max(0.0, max(y - self.predict(x, 0.0) for x, y in self.observations))
+
+    def predict(self, units, margin=None):
+        return self.base + self.slope * units + (self.margin if margin is None else margin)
+
+    def observe(self, units, peak_mb):
+        self.observations.append((units, peak_mb))
+        del self.observations[:-HISTORY_LIMIT]
+
+
+class Scheduler:
+    def __init__(self, tool, workers=None, memory_budget_mb=None, history_path=None):
+        self.tool = tool
+        self.workers = workers or os.cpu_count() or 1
+        self.memory_budget_mb = memory_budget_mb or available_memory_mb()
+        self.history_path = history_path
+        self.model = MemoryModel(self._load_history().get(tool, []))
+
+    def _load_history(self):
+        if not self.history_path or not os.path.exists(self.history_path):
+            return {}
+        try:
+            with open(self.history_path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Ignoring scheduler history {self.history_path}: {e}")
+            return {}
+
+    def _save_history(self):
+        if not self.history_path:
+            return
+        history = self._load_history()
+        history[self.tool] = self.model.observations
+        with open(self.history_path, "w") as f:
+            json.dump(history, f)
+
+    def run(self, func, jobs):
+        # jobs: [(key, args, units)]. Yields (key, func(*args)) as jobs finish, largest first.
+        # concurrent.futures is imported here so the drivers' sequential runs start as fast as before
+        from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+        pending = sorted(jobs, key=lambda job: job[2], reverse=True)
+        if not pending:
+            return
+        profiled_as = self.tool if profiling.active() is not None else None
+        estimates = {key: self.model.predict(units) for key, _, units in pending}
+        running = {}  # future -> (key, units)
+        in_flight_mb = 0.0
+        peaks = []
+
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(pending))) as pool:
+            while pending or running:
+                # start the largest pending jobs that fit the budget (any one job when idle)
+                i = 0
+                while i < len(pending) and len(running) < self.workers:
+                    key, args, units = pending[i]
+                    if running and self.memory_budget_mb and in_flight_mb + estimates[key] > self.memory_budget_mb:
+                        i += 1
+                        continue
+                    del pending[i]
+                    future = pool.submit(_run_job, profiled_as, func, args)
+                    running[future] = (key, units)
+                    in_flight_mb += estimates[key]
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key, units = running.pop(future)
+                    in_flight_mb -= estimates[key]
+                    result, peak_mb, report = future.result()
+                    profiling.merge_worker(report)
+                    if peak_mb is not None:
+                        self.model.observe(units, peak_mb)
+                        peaks.append((peak_mb, estimates[key], key))
+                    yield key, result
+
+        self.report(peaks)
+        self.model.fit()
+        self._save_history()
+
+    def report(self, peaks):
+        budget = f"{self.memory_budget_mb:.0f} MB" if self.memory_budget_mb else "none"
+        print(f"Scheduler: {self.workers} worker(s), memory budget {budget}")
+        if peaks:
+            peak_mb, estimate_mb, key = max(peaks)
+            print(f"  Worker peak RSS {peak_mb:.1f} MB ({key}, estimated {estimate_mb:.1f} MB); "
+                  f"mean {sum(p for p, _, _ in peaks) / len(peaks):.1f} MB over {len(peaks)} job(s)")
+
+
+def add_arguments(parser):
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Worker processes; jobs are started largest first within --memory-budget (default: 1)")
+    parser.add_argument("--memory-budget", type=float, default=None, metavar="MB",
+                        help="With --jobs, cap the estimated memory of jobs running at once (default: available memory)")
+    parser.add_argument("--memory-history", default=".scheduler_history.json", metavar="JSON",
+                        help="Where worker peak memory is kept to improve the estimates (default: .scheduler_history.json)")
+
+
+def from_args(args, tool):
+    # None (the sequential path) unless --jobs is above 1
+    if args.jobs <= 1:
+        return None
+    if args.memory_budget is not None and args.memory_budget <= 0:
+        raise SystemExit("--memory-budget must be positive")
+    return Scheduler(tool, args.jobs, args.memory_budget, args.memory_history)
@@ -0,0 +1,241 @@
+import json
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+class StageRecord:
+    __slots__ = ("stage", "file", "wall_s", "cpu_s", "bytes_read", "samples")
+
+    def __init__(self, stage, file=None):
+        self.stage = stage
+        self.file = file
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self.bytes_read = 0
+        self.samples = 0
+
+    def as_dict(self):
+        return {
+            "stage": self.stage,
+            "file": self.file,
+            "wall_s": round(self.wall_s, 6),
+            "cpu_s": round(self.cpu_s, 6),
+            "bytes_read": self.bytes_read,
+            "samples": self.samples,
+        }
+
+
+class _Stage:
+    # Context manager returned by Profiler.stage(); yields the StageRecord so the
+    # caller can fill in bytes_read / samples while the stage runs.
+    __slots__ = ("profiler", "record", "wall0", "cpu0")
+
+    def __init__(self, profiler, record):
+        self.profiler = profiler
+        self.record = record
+
+    def __enter__(self):
+        self.wall0 = time.perf_counter()
+        self.cpu0 = time.thread_time()
+        return self.record
+
+    def __exit__(self, exc_type, exc, tb):
+        self.record.wall_s = time.perf_counter() - self.wall0
+        self.record.cpu_s = time.thread_time() - self.cpu0
+        self.profiler._add(self.record)
+        return False
+
+
+class _NullStage:
+    # Shared no-op stage used while profiling is disabled
+    __slots__ = ()
+    stage = file = None
+    wall_s = cpu_s = 0.0
+    bytes_read = samples = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Profiler:
+    def __init__(self, tool):
+        self.tool = tool
+        self.records = []
+        self.started = time.perf_counter()
+        self.cpu_started = time.process_time()
+        self.worker_peak_rss_mb = None  # largest peak RSS reported by a worker process
+        self._lock = threading.Lock()
+
+    def stage(self, name, file=None):
+        return _Stage(self, StageRecord(name, file))
+
+    def _add(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def merge(self, record_dicts, worker_peak_rss_mb=None):
+        # Fold in StageRecord.as_dict() output and the peak RSS of a worker process
+        if worker_peak_rss_mb is not None:
+            with self._lock:
+                self.worker_peak_rss_mb = max(self.worker_peak_rss_mb or 0.0, worker_peak_rss_mb)
+        for d in record_dicts:
+            record = StageRecord(d["stage"], d["file"])
+            record.wall_s = d["wall_s"]
+            record.cpu_s = d["cpu_s"]
+            record.bytes_read = d["bytes_read"]
+            record.samples = d["samples"]
+            self._add(record)
+
+    def stage_totals(self):
+        totals = {}
+        for r in self.records:
+            t = totals.setdefault(r.stage, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0,
+                                            "bytes_read": 0, "samples": 0})
+            t["calls"] += 1
+            t["wall_s"] += r.wall_s
+            t["cpu_s"] += r.cpu_s
+            t["bytes_read"] += r.bytes_read
+            t["samples"] += r.samples
+        for t in totals.values():
+            t["samples_per_s"] = t["samples"] / t["wall_s"] if t["wall_s"] > 0 else None
+            t["mb_per_s"] = t["bytes_read"] / 1e6 / t["wall_s"] if t["wall_s"] > 0 else None
+        return totals
+
+    def file_totals(self):
+        totals = {}
+        for r in self.records:
+            if r.file is None:
+                continue
+            t = totals.setdefault(r.file, {"wall_s": 0.0, "cpu_s": 0.0, "bytes_read": 0,
+                                           "samples": 0, "stages": {}})
+            t["wall_s"] += r.wall_s
+            t["cpu_s"] += r.cpu_s
+            t["bytes_read"] += r.bytes_read
+            t["samples"] += r.samples
+            t["stages"][r.stage] = t["stages"].get(r.stage, 0.0) + r.wall_s
+        return totals
+
+    def metrics(self):
+        return {
+            "tool": self.tool,
+            "wall_s": time.perf_counter() - self.started,
+            "cpu_s": time.process_time() - self.cpu_started,
+            "peak_rss_mb": peak_rss_mb(),  # this (parent) process only
+            "worker_peak_rss_mb": self.worker_peak_rss_mb,
+            "stages": self.stage_totals(),
+            "files": self.file_totals(),
+            "records": [r.as_dict() for r in self.records],
+        }
+
+    def slowest_table(self, top_n=10):
+        files = sorted(self.file_totals().items(), key=lambda kv: kv[1]["wall_s"], reverse=True)
+        lines = [f"Top {min(top_n, len(files))} slowest drops/files ({self.tool}):",
+                 f"  {'wall s':>9} {'cpu s':>9} {'MB read':>9} {'samples':>9}  file / slowest stage"]
+        for name, t in files[:top_n]:
+            slowest = max(t["stages"].items(), key=lambda kv: kv[1])[0] if t["stages"] else ""
+            lines.append(f"  {t['wall_s']:9.3f} {t['cpu_s']:9.3f} {t['bytes_read'] / 1e6:9.2f} "
+                         f"{t['samples']:9d}  {name} ({slowest})")
+        return "\n".join(lines)
+
+    def write(self, json_path, top_n=10):
+        metrics = self.metrics()
+        with open(json_path, "w") as f:
+            json.dump(metrics, f, indent=2)
+        print(self.slowest_table(top_n))
+        print(format_peak_rss(metrics["peak_rss_mb"], metrics["worker_peak_rss_mb"]))
+        print(f"Profile metrics written to: {json_path}")
+
+
+def format_peak_rss(parent_mb, worker_mb=None):
+    parent = "n/a" if parent_mb is None else f"{parent_mb:.1f} MB"
+    if worker_mb is None:
+        return f"Peak RSS: {parent}"
+    return f"Peak RSS: {parent} (parent process), {worker_mb:.1f} MB (largest worker)"
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux
+    if sys.platform == "darwin":
+        return rss / (1024 * 1024)
+    return rss / 1024
+
+
+# Module-level profiler; None while profiling is disabled so every stage() call
+# is a single global lookup returning the shared no-op context.
+_profiler = None
+
+
+def enable(tool):
+    global _profiler
+    _profiler = Profiler(tool)
+    return _profiler
+
+
+def disable():
+    global _profiler
+    _profiler = None
+
+
+def active():
+    return _profiler
+
+
+def stage(name, file=None):
+    if _profiler is None:
+        return _NULL_STAGE
+    return _profiler.stage(name, file)
+
+
+def worker_tool():
+    # What a parent passes to run_profiled: its tool name, or None while profiling is disabled
+    return None if _profiler is None else _profiler.tool
+
+
+def run_profiled(tool, func, *args):
+    # Runs func(*args) in a worker process, profiled as `tool` unless it is None. Returns
+    # (result, report); the parent folds the report into its own profiler with merge_worker.
+    if tool is None:
+        return func(*args), None
+    profiler = enable(tool)
+    result = func(*args)
+    return result, {"records": [r.as_dict() for r in profiler.records], "peak_rss_mb": peak_rss_mb()}
+
+
+def merge_worker(report):
+    if _profiler is not None and report is not None:
+        _profiler.merge(report["records"], report["peak_rss_mb"])
+
+
+def add_arguments(parser):
+    parser.add_argument("--profile", metavar="JSON", default=None,
+                        help="Record per-stage wall/CPU time, bytes read, samples and peak RSS to this JSON file")
+    parser.add_argument("--profile-top", metavar="N", type=int, default=10,
+                        help="Number of slowest drops/files to list when profiling (default: 10)")
+
+
+def start_from_args(args, tool):
+    if args.profile:
+        enable(tool)
+
+
+def finish_from_args(args):
+    if args.profile and _profiler is not None:
+        _profiler.write(args.profile, args.profile_top)
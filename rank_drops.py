@@ -0,0 +1,167 @@
+import argparse
+import heapq
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import compressed_io
+import csv_process
+import profiling
+
+
+# Campaign-wide "worst drops" ranking over the per-drop comparison CSVs written by
+# acs_avaps_compare. Each file is reduced to a few numbers per variable, which go into
+# per-variable, per-metric top-K heaps, so memory stays constant however many drops there are.
+# Files are split into chunks ranked in parallel worker processes; the chunk heaps are merged.
+
+METRICS = {
+    # metric: (column heading, format)
+    "rms": ("RMS diff", "{:.4f}"),
+    "max_abs": ("max |diff|", "{:.4f}"),
+    "exceed_rate": ("exceeded", "{:.1f}%"),
+}
+
+
+def drop_metrics(values, threshold):
+    # values: non-empty list of valid differences for one variable of one drop
+    n = len(values)
+    exceeded = sum(1 for v in values if abs(v) > threshold)
+    return {
+        "rms": math.sqrt(math.fsum(v * v for v in values) / n),
+        "max_abs": max(abs(v) for v in values),
+        "exceed_rate": 100 * exceeded / n,
+        "points": n,
+    }
+
+
+class TopK:
+    # The k largest (score, drop, row) entries seen, as a min-heap
+    def __init__(self, k):
+        self.k = k
+        self.heap = []
+
+    def push(self, score, drop, row):
+        entry = (score, drop, row)
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, entry)
+        elif entry[:2] > self.heap[0][:2]:
+            heapq.heapreplace(self.heap, entry)
+
+    def merge(self, other):
+        for entry in other.heap:
+            self.push(*entry)
+
+    def ranked(self):
+        return sorted(self.heap, reverse=True)
+
+
+class Ranking:
+    def __init__(self, k, min_points=1):
+        self.k = k
+        self.min_points = min_points
+        self.drops = 0
+        self.tops = {(column, metric): TopK(k) for column in csv_process.THRESHOLDS for metric in METRICS}
+
+    def add(self, drop, columns):
+        # columns: {difference column: [valid values]} for one drop
+        self.drops += 1
+        for column, values in columns.items():
+            if len(values) < max(self.min_points, 1):
+                continue
+            metrics = drop_metrics(values, csv_process.THRESHOLDS[column])
+            row = tuple(metrics[m] for m in METRICS) + (metrics["points"],)
+            for metric in METRICS:
+                self.tops[(column, metric)].push(metrics[metric], drop, row)
+
+    def merge(self, other):
+        self.drops += other.drops
+        for key, top in other.tops.items():
+            self.tops[key].merge(top)
+
+    def format(self, variables=None, metrics=None):
+        lines = [f"Worst drops across {self.drops} drop(s), top {self.k} per variable and metric\n"]
+        for column in csv_process.THRESHOLDS:
+            variable = csv_process.variable_name(column)
+            if variables and variable not in variables:
+                continue
+            for metric, (heading, _) in METRICS.items():
+                if metrics and metric not in metrics:
+                    continue
+                lines.append(f"\n=== {variable}: by {heading} (tolerance {csv_process.THRESHOLDS[column]}) ===\n")
+                ranked = self.tops[(column, metric)].ranked()
+                if not ranked:
+                    lines.append("  No valid data.\n")
+                    continue
+                lines.append(f"  {'rank':>4}  {'drop':<16}" + "".join(f"{h:>12}" for h, _ in METRICS.values())
+                             + f"{'points':>8}\n")
+                for rank, (_, drop, row) in enumerate(ranked, start=1):
+                    lines.append(f"  {rank:>4}  {drop:<16}"
+                                 + "".join(f"{fmt.format(value):>12}" for value, (_, fmt) in zip(row, METRICS.values()))
+                                 + f"{row[-1]:>8}\n")
+        return "".join(lines)
+
+
+def rank_files(csv_files, k, min_points=1):
+    ranking = Ranking(k, min_points)
+    for csv_path in csv_files:
+        name = csv_process.drop_name(csv_path)
+        with profiling.stage("read_csv", file=name) as st:
+            columns, rows = csv_process.read_difference_columns(csv_path)
+            st.samples += rows
+        ranking.add(name, columns)
+    return ranking
+
+
+def rank_directory(directory, k=20, min_points=1, jobs=1):
+    with profiling.stage("scan_directory") as st:
+        csv_files = compressed_io.find_csv_files(directory, "[0-9]*")
+        st.samples += len(csv_files)
+    if jobs <= 1 or len(csv_files) < 2:
+        return rank_files(csv_files, k, min_points)
+
+    chunks = [csv_files[i::jobs * 4] for i in range(min(jobs * 4, len(csv_files)))]
+    ranking = Ranking(k, min_points)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(profiling.run_profiled, profiling.worker_tool(), rank_files, chunk, k, min_points)
+                   for chunk in chunks]
+        for future in futures:
+            chunk_ranking, report = future.result()
+            ranking.merge(chunk_ranking)
+            profiling.merge_worker(report)
+    return ranking
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rank the worst drops per variable from the per-drop comparison CSVs.")
+    parser.add_argument("directory", help="Directory of per-drop CSVs written by acs_avaps_compare.py (e.g. processed)")
+    parser.add_argument("--top", type=int, default=20, metavar="K", help="Drops listed per variable and metric (default: 20)")
+    parser.add_argument("--variable", action="append", default=None,
+                        help="Only rank this variable (Pressure, Temperature, Humidity, U, V); may be repeated")
+    parser.add_argument("--metric", action="append", choices=list(METRICS), default=None,
+                        help="Only rank by this metric; may be repeated")
+    parser.add_argument("--min-points", type=int, default=1,
+                        help="Ignore variables of drops with fewer valid differences than this (default: 1)")
+    parser.add_argument("--jobs", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--output", default=None, help="Also write the ranking to this file")
+    compressed_io.add_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        print(f"Error: {args.directory} is not a valid directory.")
+        return
+
+    profiling.start_from_args(args, "rank_drops")
+    ranking = rank_directory(args.directory, args.top, args.min_points, args.jobs or os.cpu_count() or 1)
+    report = ranking.format(args.variable, args.metric)
+    print(report, end="")
+    if args.output:
+        output = compressed_io.with_compression(args.output, args.compress)
+        with compressed_io.open_text(output, "w") as f:
+            f.write(report)
+        print(f"Ranking written to: {output}")
+    profiling.finish_from_args(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# Puts ACS and AVAPS soundings on one uniform time grid, so every comparison row has both
+# systems instead of relying on exact timetag matches. Each variable is interpolated linearly
+# over whole arrays at once. A grid point gets no value when the nearest valid samples on
+# either side are more than max_gap_s apart, or when it lies outside the samples. Wind is
+# interpolated as u/v components and converted back to speed and direction. A grid point that
+# falls on a sample keeps that sample's values exactly, wind included. NumPy (and sounding) are
+# imported by the functions that need them, so the drivers can add the grid options without it.
+
+WIND_COLUMNS = ("WindSpeed", "WindDirection")
+
+
+class Grid:
+    __slots__ = ("hz", "max_gap_s")
+
+    def __init__(self, hz, max_gap_s=2.0):
+        self.hz = hz
+        self.max_gap_s = max_gap_s
+
+    @property
+    def step_ms(self):
+        return 1000.0 / self.hz
+
+    def times(self, start_ms, end_ms):
+        # Grid points in [start_ms, end_ms], on multiples of the step so grids of different
+        # drops (and runs) line up
+        import numpy as np
+
+        step = self.step_ms
+        first = np.ceil(start_ms / step)
+        last = np.floor(end_ms / step)
+        if last < first:
+            return np.empty(0, dtype=np.int64)
+        return np.rint(np.arange(first, last + 1) * step).astype(np.int64)
+
+
+def interpolate(times, values, grid_times, max_gap_ms):
+    # Linear interpolation of one column onto grid_times; NaN outside the data and across gaps
+    import numpy as np
+
+    valid = ~np.isnan(values)
+    t = times[valid]
+    v = values[valid].astype(np.float64)
+    out = np.full(len(grid_times), np.nan)
+    if len(t) == 0:
+        return out
+    idx = np.searchsorted(t, grid_times, side="right")
+    exact = (idx > 0) & (t[np.maximum(idx - 1, 0)] == grid_times)
+    inside = (idx > 0) & (idx < len(t))
+    inside[inside] = t[idx[inside]] - t[idx[inside] - 1] <= max_gap_ms
+    usable = exact | inside
+    out[usable] = np.interp(grid_times[usable], t, v)
+    out[exact] = v[idx[exact] - 1]
+    return out
+
+
+def resample_sounding(snd, grid_times, max_gap_ms):
+    import numpy as np
+    import sounding
+
+    times = snd.times
+    columns = {}
+    for name, values in snd.columns.items():
+        if name not in WIND_COLUMNS:
+            columns[name] = interpolate(times, values, grid_times, max_gap_ms)
+    if all(name in snd for name in WIND_COLUMNS):
+        u, v = sounding.wind_to_uv(snd["WindSpeed"].astype(np.float64), snd["WindDirection"].astype(np.float64))
+        u = interpolate(times, u, grid_times, max_gap_ms)
+        v = interpolate(times, v, grid_times, max_gap_ms)
+        speed, direction = uv_to_wind(u, v)
+        # No u/v round trip where a grid point is a sample with both speed and direction
+        on_sample = sounding.Sounding(times, {name: snd[name] for name in WIND_COLUMNS}).align(grid_times)
+        exact = ~np.isnan(on_sample["WindSpeed"]) & ~np.isnan(on_sample["WindDirection"])
+        speed[exact] = on_sample["WindSpeed"][exact]
+        direction[exact] = on_sample["WindDirection"][exact]
+        columns["WindSpeed"] = speed
+        columns["WindDirection"] = direction
+    return sounding.Sounding(grid_times, columns, source=snd.source, sonde_id=snd.sonde_id,
+                             launch_time=snd.launch_time, pressure_offset=snd.pressure_offset)
+
+
+def uv_to_wind(u, v):
+    # Inverse of sounding.wind_to_uv: meteorological direction the wind blows from, 0-360
+    import numpy as np
+
+    speed = np.hypot(u, v)
+    direction = np.degrees(np.arctan2(-u, -v)) % 360.0
+    return speed, direction
+
+
+def common_grid(acs_sounding, avaps_sounding, grid, paired_columns=()):
+    # Both soundings resampled onto the grid over the time span they share. Grid points where
+    # none of paired_columns has a value in both soundings are dropped.
+    import numpy as np
+
+    if not len(acs_sounding) or not len(avaps_sounding):
+        grid_times = np.empty(0, dtype=np.int64)
+    else:
+        grid_times = grid.times(max(acs_sounding.times[0], avaps_sounding.times[0]),
+                                min(acs_sounding.times[-1], avaps_sounding.times[-1]))
+    max_gap_ms = grid.max_gap_s * 1000.0
+    acs = resample_sounding(acs_sounding, grid_times, max_gap_ms)
+    avaps = resample_sounding(avaps_sounding, grid_times, max_gap_ms)
+
+    pairs = [(avaps_key, acs_key) for avaps_key, acs_key in paired_columns if avaps_key in avaps and acs_key in acs]
+    if pairs:
+        keep = np.zeros(len(grid_times), dtype=bool)
+        for avaps_key, acs_key in pairs:
+            keep |= ~np.isnan(avaps[avaps_key]) & ~np.isnan(acs[acs_key])
+        if not keep.all():
+            acs = subset(acs, keep)
+            avaps = subset(avaps, keep)
+    return acs, avaps
+
+
+def subset(snd, mask):
+    import sounding
+
+    return sounding.Sounding(snd.times[mask], {name: values[mask] for name, values in snd.columns.items()},
+                             source=snd.source, sonde_id=snd.sonde_id, launch_time=snd.launch_time,
+                             pressure_offset=snd.pressure_offset)
+
+
+def add_arguments(parser):
+    parser.add_argument("--resample-hz", type=float, default=None, metavar="HZ",
+                        help="Compare on a common uniform time grid at this rate (e.g. 2 or 4) with linear "
+                             "interpolation, instead of matching identical timetags")
+    parser.add_argument("--max-gap", type=float, default=2.0, metavar="SECONDS",
+                        help="With --resample-hz, don't interpolate across gaps longer than this (default: 2)")
+
+
+def grid_from_args(args):
+    # None (exact timetag matching) unless --resample-hz was given
+    if args.resample_hz is None:
+        return None
+    if args.resample_hz <= 0 or args.max_gap <= 0:
+        raise SystemExit("--resample-hz and --max-gap must be positive")
+    return Grid(args.resample_hz, args.max_gap)
@@ -1,7 +1,9 @@
 import sys
-from netCDF4 import Dataset
 
 def show_drop_pressure_addition(nc_file_path):
+    # Deferred so the usage message doesn't wait on the netCDF4/HDF5 import
+    from netCDF4 import Dataset
+
     try:
         with Dataset(nc_file_path, 'r') as nc:
             if "DropPressureAddition" in nc.ncattrs():
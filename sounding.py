@@ -0,0 +1,81 @@
+import numpy as np
+
+
+EPOCH = np.datetime64(0, 'ms')
+
+
+class Sounding:
+    # Columnar sounding: one sorted int64 array of sample times (milliseconds since
+    # 1970-01-01 UTC) plus one contiguous float array per variable, NaN where missing.
+    __slots__ = ("times", "columns", "source", "sonde_id", "launch_time", "pressure_offset")
+
+    def __init__(self, times, columns, source=None, sonde_id=None, launch_time=None, pressure_offset=None):
+        self.times = times
+        self.columns = columns
+        self.source = source
+        self.sonde_id = sonde_id
+        self.launch_time = launch_time
+        self.pressure_offset = pressure_offset
+
+    def __len__(self):
+        return len(self.times)
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def get(self, name, default=None):
+        return self.columns.get(name, default)
+
+    @property
+    def nbytes(self):
+        return self.times.nbytes + sum(c.nbytes for c in self.columns.values())
+
+    def timetags(self):
+        # "YYYY-MM-DDTHH:MM:SS.ssZ" strings, the timetag format used in the CSV output
+        return [s[:-1] + "Z" for s in np.datetime_as_string(EPOCH + self.times, unit='ms').tolist()]
+
+    def align(self, times):
+        # Columns re-indexed onto `times` (sorted int64 ms); NaN where this sounding has no sample
+        aligned = {name: np.full(len(times), np.nan, dtype=np.float64) for name in self.columns}
+        if not len(self.times):
+            return aligned
+        idx = np.minimum(np.searchsorted(self.times, times), len(self.times) - 1)
+        present = self.times[idx] == times
+        src = idx[present]
+        for name, values in self.columns.items():
+            aligned[name][present] = values[src]
+        return aligned
+
+
+def from_samples(times, columns, **metadata):
+    # Build a Sounding from unsorted samples; where a time repeats the last sample wins,
+    # matching the old dict-keyed-by-timetag behaviour
+    times = np.asarray(times, dtype=np.int64)
+    order = np.argsort(times, kind='stable')
+    times = times[order]
+    if len(times):
+        keep = np.ones(len(times), dtype=bool)
+        keep[:-1] = times[1:] != times[:-1]
+        order = order[keep]
+        times = times[keep]
+    columns = {name: np.ascontiguousarray(np.asarray(values)[order]) for name, values in columns.items()}
+    return Sounding(times, columns, **metadata)
+
+
+def wind_to_uv(speed, direction_deg):
+    # Meteorological wind to u/v components; NaN in either input gives NaN components
+    direction_rad = np.radians(direction_deg)
+    u = -speed * np.sin(direction_rad)  # East-West component (positive = wind from west)
+    v = -speed * np.cos(direction_rad)  # North-South component (positive = wind from south)
+    return u, v
+
+
+def round_digits(values, dec_digits, truncate=True):
+    # Vectorized acs_avaps_compare.round_digits (truncates toward zero). Interpolated values carry
+    # float noise (120 can come back as 119.99999999999999), so those are rounded to nearest instead.
+    scale = pow(10, dec_digits)
+    # + 0.0 turns the -0.0 np.trunc gives for small negatives into 0.0, as int() does
+    return (np.trunc if truncate else np.round)(values * scale) / scale + 0.0
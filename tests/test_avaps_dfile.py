@@ -0,0 +1,72 @@
+import os
+
+import numpy as np
+
+import avaps_dfile
+
+
+def drop_lines(sonde_id, launch, pressure_offset, pressures, channel="01"):
+    # One drop in D file layout: AVAPS-T metadata, a LAU record and half-second P00 data lines
+    date, time = launch
+    lines = [
+        f"AVAPS-T{channel} COM Sonde ID/Type/Rev/Built/Sensors: {sonde_id}, RD41, 1, 0, 0",
+        f"AVAPS-T{channel} COM Sonde Baseline Errors (p,t,h1,h2): {pressure_offset} mb, 0.1 deg, 0.0 %, 0.0 %",
+        f"AVAPS-T{channel} COM Launch Time (y,m,d,h,m,s): 20{date[:2]}-{date[2:4]}-{date[4:]}, "
+        f"{time[:2]}:{time[2:4]}:{time[4:]}",
+        f"AVAPS-D{channel} LAU {sonde_id} {date} {time}.00 9999.00 99.00 999.00 999.00 999.00 99.00 999.000000 "
+        f"99.000000 99999.00 0 999.00 999.00 0 99.00 99999.00",
+    ]
+    for k, pressure in enumerate(pressures):
+        seconds = int(time[4:]) + k * 0.5
+        lines.append(f"AVAPS-D{channel} P00 {sonde_id} {date} {time[:4]}{seconds:05.2f} {pressure} -39.79 50.00 "
+                     f"180.00 13.00 -12.00 -75.123456 25.123456 9000.00 10 50.00 999.00 9 0.50 9000.00")
+    return lines
+
+
+def write_two_drop_file(tmp_path):
+    lines = (drop_lines(240324590, ("250223", "203707"), -0.7, ["299.63", "303.76", "9999.00"])
+             + drop_lines(240324591, ("250223", "211000"), -0.4, ["500.10", "505.20"]))
+    path = tmp_path / "D20250223_203707.1"
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+
+def test_read_drops_splits_two_drops(tmp_path):
+    first, second = avaps_dfile.read_drops(str(write_two_drop_file(tmp_path)))
+
+    assert (first.sonde_id, first.launch_time, first.pressure_offset) == (240324590, "2025-02-23T20:37:07Z", -0.7)
+    assert (second.sonde_id, second.launch_time, second.pressure_offset) == (240324591, "2025-02-23T21:10:00Z", -0.4)
+    # LAU records are not samples; the 9999.00 pressure sentinel is missing
+    np.testing.assert_array_equal(first["Pressure"], [299.63, 303.76, np.nan])
+    np.testing.assert_array_equal(second["Pressure"], [500.10, 505.20])
+    assert first.timetags() == ["2025-02-23T20:37:07.00Z", "2025-02-23T20:37:07.50Z", "2025-02-23T20:37:08.00Z"]
+
+
+def test_read_drops_from_memory_matches_file(tmp_path):
+    path = write_two_drop_file(tmp_path)
+    from_file = avaps_dfile.read_drops(str(path))
+    from_memory = avaps_dfile.read_drops(str(path), path.read_bytes())
+    for a, b in zip(from_file, from_memory):
+        np.testing.assert_array_equal(a.times, b.times)
+        np.testing.assert_array_equal(a["Temperature"], b["Temperature"])
+
+
+def test_non_numeric_field_takes_slow_path(tmp_path):
+    path = write_two_drop_file(tmp_path)
+    path.write_text(path.read_text().replace("505.20 -39.79", "505.20 ////", 1))
+    first, second = avaps_dfile.read_drops(str(path))
+    # the unparseable line is skipped, everything else still reads
+    np.testing.assert_array_equal(first["Pressure"], [299.63, 303.76, np.nan])
+    np.testing.assert_array_equal(second["Pressure"], [500.10])
+
+
+def test_split_d_file(tmp_path):
+    written = avaps_dfile.split_d_file(str(write_two_drop_file(tmp_path)), str(tmp_path / "split"))
+
+    assert [os.path.basename(path) for path, _ in written] == ["D20250223_203707.1", "D20250223_211000.1"]
+    for path, drop in written:
+        (single,) = avaps_dfile.read_drops(path)
+        assert single.sonde_id == drop.sonde_id
+        assert len(single) == len(drop.numbers)
+    with open(written[1][0]) as f:
+        assert f.readline().startswith("AVAPS-T01 COM Sonde ID/Type/Rev/Built/Sensors: 240324591")
@@ -0,0 +1,53 @@
+import numpy as np
+
+import clock_offset
+import sounding
+
+
+def make_pair(offset_ms, seed=1):
+    # ACS and AVAPS soundings of one random-walk profile; the ACS clock runs offset_ms ahead
+    rng = np.random.default_rng(seed)
+    t = np.arange(0, 600_000, 250, dtype=np.int64)
+    pressure = 300 + np.cumsum(rng.normal(0.0, 0.5, len(t)))
+    temperature = -40 + np.cumsum(rng.normal(0.0, 0.1, len(t)))
+    avaps = sounding.Sounding(t, {"Pressure": pressure, "Temperature": temperature})
+    # a constant pressure bias must not matter
+    acs = sounding.Sounding(t + offset_ms, {"Pressure": pressure + 0.7, "Temperature": temperature.copy()})
+    return acs, avaps
+
+
+def test_recovers_known_shift():
+    for offset_ms in (1500, -3000, 7250):
+        offset = clock_offset.estimate_offset(*make_pair(offset_ms))
+        assert abs(offset.offset_ms - offset_ms) < 100
+        assert offset.correlation > 0.8
+
+
+def test_aligned_clocks_give_zero():
+    offset = clock_offset.estimate_offset(*make_pair(0))
+    assert offset.offset_ms == 0
+
+
+def test_featureless_series_give_no_offset():
+    t = np.arange(0, 60_000, 500, dtype=np.int64)
+    linear = sounding.Sounding(t, {"Pressure": 300 + t / 1000.0, "Temperature": -40 + t / 10000.0})
+    assert clock_offset.estimate_offset(linear, linear) is None
+
+
+def test_masked_correlation_ignores_gaps():
+    rng = np.random.default_rng(2)
+    y = rng.normal(size=400)
+    x = np.roll(y, 5)  # x[i + 5] == y[i]
+    x[100:140] = np.nan
+    corr, overlap = clock_offset.masked_correlation(x, y, 10)
+    assert int(np.nanargmax(corr)) - 10 == 5
+    assert overlap[10 + 5] == 400 - 5 - 40
+
+
+def test_apply_offset_moves_acs_onto_avaps_clock():
+    acs, avaps = make_pair(1500)
+    shifted = clock_offset.apply_offset(acs, avaps, clock_offset.ClockOffset(1500, 1.0))
+    np.testing.assert_array_equal(shifted.times, avaps.times)
+    valid = ~np.isnan(shifted["Temperature"])
+    np.testing.assert_allclose(shifted["Temperature"][valid], avaps["Temperature"][valid])
+    assert clock_offset.apply_offset(acs, avaps, clock_offset.ClockOffset(0, 1.0)) is acs
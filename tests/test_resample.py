@@ -0,0 +1,70 @@
+import argparse
+
+import numpy as np
+import pytest
+
+import acs_avaps_compare
+import resample
+import sounding
+
+
+def make_sounding():
+    times = np.arange(0, 5000, 500, dtype=np.int64)
+    return sounding.Sounding(times, {
+        "Temperature": np.array([20.1, 19.95, 19.8, 19.62, 19.5, np.nan, 19.1, 18.97, 18.8, 18.66]),
+        "WindSpeed": np.array([4.74, 5.0, 120.0, 7.31, 0.0, 3.3, 9.99, 12.5, 6.05, 8.0]),
+        "WindDirection": np.array([270.0, 359.99, 45.5, 180.0, 0.0, 90.01, 123.45, 300.0, 10.0, np.nan]),
+    })
+
+
+def test_resample_at_own_times_is_unchanged():
+    snd = make_sounding()
+    resampled = resample.resample_sounding(snd, snd.times, 2000.0)
+    np.testing.assert_array_equal(resampled.times, snd.times)
+    np.testing.assert_array_equal(resampled["Temperature"][[0, 1, 2, 3, 4, 6, 7, 8, 9]],
+                                  snd["Temperature"][[0, 1, 2, 3, 4, 6, 7, 8, 9]])
+    # Samples with both speed and direction come back exactly, not through u/v and back
+    np.testing.assert_array_equal(resampled["WindSpeed"][:9], snd["WindSpeed"][:9])
+    np.testing.assert_array_equal(resampled["WindDirection"][:9], snd["WindDirection"][:9])
+
+
+def test_resample_interpolates_between_samples():
+    snd = make_sounding()
+    resampled = resample.resample_sounding(snd, np.array([250, 2750], dtype=np.int64), 2000.0)
+    # 2750 lies across the missing 2500 sample, between the valid ones at 2000 and 3000
+    np.testing.assert_allclose(resampled["Temperature"], [20.025, 19.2])
+
+
+def test_resample_leaves_gaps_empty():
+    snd = make_sounding()
+    resampled = resample.resample_sounding(snd, np.array([250], dtype=np.int64), 100.0)
+    assert np.isnan(resampled["Temperature"]).all()
+
+
+def test_self_comparison_on_grid_has_no_differences():
+    snd = make_sounding()
+    acs, avaps = resample.common_grid(snd, snd, resample.Grid(2.0))
+    table = acs_avaps_compare.build_comparison_table(acs, avaps, interpolated=True)
+    for name in ("AVAPS - ACS WindSpeed", "AVAPS - ACS WindDirection"):
+        diffs = table[name][~np.isnan(table[name])]
+        assert len(diffs) and not diffs.any()
+
+
+def test_round_digits():
+    values = np.array([119.99999999999999, 4.740000000000001, -0.001])
+    np.testing.assert_array_equal(sounding.round_digits(values, 2), [119.99, 4.74, 0.0])
+    np.testing.assert_array_equal(sounding.round_digits(values, 2, truncate=False), [120.0, 4.74, 0.0])
+
+
+def parse(argv):
+    parser = argparse.ArgumentParser()
+    resample.add_arguments(parser)
+    return resample.grid_from_args(parser.parse_args(argv))
+
+
+def test_grid_from_args():
+    assert parse([]) is None
+    assert parse(["--resample-hz", "4"]).step_ms == 250.0
+    for hz in ("0", "-2"):
+        with pytest.raises(SystemExit):
+            parse(["--resample-hz", hz])
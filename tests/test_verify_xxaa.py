@@ -0,0 +1,57 @@
+import math
+
+import numpy as np
+
+import decode_xxaa_directory
+import verify_xxaa
+
+
+# Part A of D20250223_203707_P.WMO, and hand-decoded physical values of its mandatory levels:
+# (height m, temperature degC, dewpoint depression degC, wind direction deg, wind speed kt)
+MESSAGE = ["XXAA 73207 99170 70650 11673 99012 25424 10525 00110 24816 11020 92785 20215 13520 85495 16216 "
+           "15526 70120 07356 16531 50582 12170 18035 40750 23969 19040 30950 39570 20542 25065 48769 21048"]
+EXPECTED = {
+    1000: (110, 24.8, 1.6, 110, 20),
+    925: (785, 20.2, 1.5, 135, 20),
+    850: (1495, 16.2, 1.6, 155, 26),
+    700: (3120, -7.3, 6.0, 165, 31),
+    500: (5820, -12.1, 20.0, 180, 35),
+    400: (7500, -23.9, 19.0, 190, 40),
+    300: (9500, -39.5, 20.0, 205, 42),
+    250: (10650, -48.7, 19.0, 210, 48),
+}
+
+
+def levels(block):
+    record = decode_xxaa_directory.decode_xxaa_block(block)
+    values = verify_xxaa.encoded_levels(record)
+    return {int(level): tuple(row) for level, row in zip(verify_xxaa.MANDATORY_LEVELS, values)}
+
+
+def test_encoded_levels_of_message():
+    decoded = levels(MESSAGE)
+    for level, expected in EXPECTED.items():
+        np.testing.assert_allclose(decoded[level], expected, err_msg=f"{level} hPa")
+
+
+def test_hand_encoded_groups():
+    # 1000 hPa below sea level (hhh 540 -> -40 m), 700 hPa below 3000 m (hhh 950 -> 2950 m),
+    # 250 hPa below 10000 m (hhh 980 -> 9800 m), a 148 kt wind (ddd 216 -> 215 deg + 100 kt),
+    # dewpoint depressions at the 5.0 / 6.0 degC code boundary
+    block = ["XXAA 73207 99170 70650 11673 00540 01250 27005 70950 10656 31515 25980 50556 21648"]
+    decoded = levels(block)
+    np.testing.assert_allclose(decoded[1000], (-40, 1.2, 5.0, 270, 5))
+    np.testing.assert_allclose(decoded[700], (2950, 10.6, 6.0, 315, 15))
+    np.testing.assert_allclose(decoded[250], (9800, -50.5, 6.0, 215, 148))
+    assert all(math.isnan(v) for v in decoded[500])
+
+
+def test_encoded_scalars():
+    assert verify_xxaa.encoded_height(850, 0) == 1000
+    assert verify_xxaa.encoded_height(500, 582) == 5820
+    assert verify_xxaa.encoded_height(300, 20) == 10200
+    assert verify_xxaa.encoded_temperature(0.1) == -0.1
+    assert verify_xxaa.encoded_temperature(0.0) == 0.0
+    assert math.isnan(verify_xxaa.encoded_dewpoint_depression(5.3))  # codes 51-55 are unused
+    assert verify_xxaa.encoded_wind(359, 99) == (355.0, 499.0)
+    assert all(math.isnan(v) for v in verify_xxaa.encoded_wind(None, 10))
@@ -0,0 +1,298 @@
+import argparse
+import csv
+import math
+import os
+from collections import defaultdict
+
+import numpy as np
+
+import acs_avaps_compare
+import campaign_pipeline
+import compare_acs_avaps_csv
+import compressed_io
+import decode_xxaa_directory
+import profiling
+import resample
+import sounding
+
+
+# Checks encoded TEMP (XXAA) mandatory levels against the high-resolution sounding each message
+# was made from: ACS messages against the ACS NetCDF profile, AVAPS messages against the D file.
+# The profiles of all drops are interpolated to the mandatory levels together, linear in
+# log(pressure), with one searchsorted per variable over the concatenated profiles; each drop's
+# pressures are offset by drop index * PRESSURE_OFFSET so the drops stay apart in one sorted array.
+
+MANDATORY_LEVELS = np.array(sorted(decode_xxaa_directory.PRESSURE_MAP.values(), reverse=True), dtype=np.float64)
+FIELDS = ("height_m", "temp_C", "dewpt_dep_C", "wind_dir_deg", "wind_spd_kt")
+PRESSURE_OFFSET = 10000.0  # hPa, above any pressure in a profile
+KNOTS_PER_MS = 1 / 0.514444
+
+OUTPUT_FIELDS = ["drop_time", "system", "wmo_file", "profile_file", "level_hPa", "field",
+                 "encoded", "profile", "diff", "tolerance", "within_tolerance"]
+
+
+# Encoded values, as decoded by decode_xxaa_directory, to physical units
+
+def encoded_height(level, hhh):
+    # geopotential metres from the 3-digit hhh of each standard level
+    if hhh is None:
+        return math.nan
+    if level in (1000, 925):
+        return hhh  # metres (1000 hPa negatives already handled by decode_group)
+    if level == 850:
+        return 1000 + hhh  # metres, thousands digit omitted
+    if level == 700:
+        return (3000 if hhh < 500 else 2000) + hhh  # metres, thousands digit omitted
+    if level in (500, 400):
+        return hhh * 10  # decametres
+    return (hhh + 1000 if hhh < 500 else hhh) * 10  # 300/250 hPa: decametres, thousands digit omitted
+
+
+def encoded_temperature(temp):
+    # TTTa: the tenths digit is even for positive and odd for negative temperatures
+    if temp is None:
+        return math.nan
+    tenths = round(temp * 10)
+    return -temp if tenths % 2 else temp
+
+
+def encoded_dewpoint_depression(dew):
+    # DD: 00-50 tenths of a degree up to 5.0, 56-99 whole degrees + 50
+    if dew is None:
+        return math.nan
+    code = round(dew * 10)
+    if code <= 50:
+        return code / 10
+    if code >= 56:
+        return float(code - 50)
+    return math.nan
+
+
+def encoded_wind(direction, speed):
+    # dddff: direction in 5 degree steps; the units digit of ddd carries the hundreds of ff
+    if direction is None or speed is None:
+        return math.nan, math.nan
+    hundreds = direction % 5
+    return float(direction - hundreds), float(speed + 100 * hundreds)
+
+
+def encoded_levels(record):
+    # (levels, FIELDS) array of physical values from a decoded XXAA record, NaN where not reported
+    values = np.full((len(MANDATORY_LEVELS), len(FIELDS)), np.nan)
+    for k, level in enumerate(MANDATORY_LEVELS.astype(int).tolist()):
+        direction, speed = encoded_wind(record.get(f"{level}_wind_dir_deg"), record.get(f"{level}_wind_spd_kt"))
+        values[k] = (encoded_height(level, record.get(f"{level}_height_m")),
+                     encoded_temperature(record.get(f"{level}_temp_C")),
+                     encoded_dewpoint_depression(record.get(f"{level}_dewpt_dep_C")),
+                     direction, speed)
+    return values
+
+
+# Raw profiles
+
+def dewpoint(temp_c, rh):
+    # Magnus formula over water, degC
+    gamma = np.log(np.clip(rh, 1e-3, None) / 100) + 17.67 * temp_c / (temp_c + 243.5)
+    return 243.5 * gamma / (17.67 - gamma)
+
+
+def profile_columns(snd):
+    def column(name):
+        return snd[name].astype(np.float64) if name in snd else np.full(len(snd), np.nan)
+
+    temp = column("Temperature")
+    u, v = sounding.wind_to_uv(column("WindSpeed"), column("WindDirection"))
+    return {
+        "pressure": column("Pressure"),
+        "height_m": column("GeoAltitude"),
+        "temp_C": temp,
+        "dewpt_dep_C": temp - dewpoint(temp, column("Humidity")),
+        "u": u,
+        "v": v,
+    }
+
+
+def interpolate_to_levels(profiles, levels=MANDATORY_LEVELS, max_span_hpa=10.0):
+    # {variable: (len(profiles), len(levels))} interpolated linearly in log(pressure); NaN where a
+    # level is outside a profile or its nearest samples are more than max_span_hpa apart
+    n = len(profiles)
+    query_drop = np.repeat(np.arange(n), len(levels))
+    query_p = np.tile(levels, n)
+    query_keys = query_drop * PRESSURE_OFFSET + query_p
+    drop_ids = np.concatenate([np.full(len(p["pressure"]), i) for i, p in enumerate(profiles)] + [np.empty(0, int)])
+    pressure = np.concatenate([p["pressure"] for p in profiles] + [np.empty(0)])
+
+    out = {}
+    for name in ("height_m", "temp_C", "dewpt_dep_C", "u", "v"):
+        values = np.concatenate([p[name] for p in profiles] + [np.empty(0)])
+        result = np.full(len(query_keys), np.nan)
+        ok = np.isfinite(pressure) & np.isfinite(values) & (pressure > 0) & (pressure < PRESSURE_OFFSET)
+        d, p, v = drop_ids[ok], pressure[ok], values[ok]
+        if len(p):
+            order = np.lexsort((p, d))
+            d, p, v = d[order], p[order], v[order]
+            keys = d * PRESSURE_OFFSET + p
+            hi = np.searchsorted(keys, query_keys)  # first sample at or below the level (p >= level)
+            lo = hi - 1
+            hi_c = np.minimum(hi, len(keys) - 1)
+            lo_c = np.maximum(lo, 0)
+            exact = (hi < len(keys)) & (keys[hi_c] == query_keys)
+            between = (~exact & (lo >= 0) & (hi < len(keys)) & (d[lo_c] == query_drop) & (d[hi_c] == query_drop)
+                       & (p[hi_c] - p[lo_c] <= max_span_hpa))
+            lo_b, hi_b = lo[between], hi[between]
+            weight = (np.log(query_p[between]) - np.log(p[lo_b])) / (np.log(p[hi_b]) - np.log(p[lo_b]))
+            result[between] = v[lo_b] + weight * (v[hi_b] - v[lo_b])
+            result[exact] = v[hi_c[exact]]
+        out[name] = result.reshape(n, len(levels))
+    return out
+
+
+def profile_levels(profiles, max_span_hpa=10.0):
+    # (drops, levels, FIELDS) raw-profile values at the mandatory levels, wind in degrees / knots
+    interpolated = interpolate_to_levels(profiles, MANDATORY_LEVELS, max_span_hpa)
+    speed, direction = resample.uv_to_wind(interpolated["u"], interpolated["v"])
+    return np.stack([interpolated["height_m"], interpolated["temp_C"], interpolated["dewpt_dep_C"],
+                     direction, speed * KNOTS_PER_MS], axis=-1)
+
+
+# Campaign
+
+def find_messages(directory):
+    # [(system, drop_time, wmo_file, profile_file, decoded record)] for every decoded XXAA message
+    # whose source profile (NetCDF for ACS, D file for AVAPS) is present
+    files = campaign_pipeline.discover(directory)
+    d_index = acs_avaps_compare.index_d_files(files.d_files)
+    netcdf_by_time = {}
+    for nc_file in files.netcdf_files:
+        netcdf_by_time.setdefault(acs_avaps_compare.extract_launch_time(os.path.basename(nc_file)), nc_file)
+
+    messages = []
+    for wmo_file in files.wmo_files:
+        name = os.path.basename(wmo_file)
+        record = decode_xxaa_directory.decode_file_block(name, decode_xxaa_directory.extract_xxaa_block(wmo_file))
+        if not record:
+            continue
+        drop_time = record["drop_time"]
+        if name.startswith("D"):
+            system, profile_file = "AVAPS", acs_avaps_compare.lookup_d_file(
+                d_index, os.path.dirname(wmo_file), drop_time)
+        else:
+            system, profile_file = "ACS", netcdf_by_time.get(drop_time)
+        if profile_file is None:
+            print(f"Warning: No {system} profile found for {name}.")
+            continue
+        messages.append((system, drop_time, wmo_file, profile_file, record))
+    return messages
+
+
+def read_profile(system, profile_file, drop_time):
+    with profiling.stage("read_netcdf" if system == "ACS" else "read_dfile", file=drop_time) as st:
+        if system == "ACS":
+            snd = acs_avaps_compare.read_acs_sounding(profile_file)
+        else:
+            snd = acs_avaps_compare.read_avaps_sounding(profile_file, drop_time)
+        st.samples += len(snd)
+    return profile_columns(snd)
+
+
+def verify_directory(directory, output_dir=".", compression=None, max_span_hpa=10.0):
+    messages = sorted(find_messages(directory), key=lambda m: (m[1], m[0]))
+    print(f"Found {len(messages)} XXAA messages with a matching profile.")
+    if not messages:
+        return None
+
+    profiles = [read_profile(system, profile_file, drop_time) for system, drop_time, _, profile_file, _ in messages]
+    with profiling.stage("interpolate") as st:
+        raw = profile_levels(profiles, max_span_hpa)
+        st.samples += sum(len(p["pressure"]) for p in profiles)
+    encoded = np.stack([encoded_levels(record) for *_, record in messages])
+
+    diff = raw - encoded
+    direction = FIELDS.index("wind_dir_deg")
+    diff[..., direction] = (diff[..., direction] + 180) % 360 - 180
+    tolerance = np.array([[compare_acs_avaps_csv.FIELD_THRESHOLDS.get(f"{int(level)}_{field}", 0) for field in FIELDS]
+                          for level in MANDATORY_LEVELS])
+    within = np.abs(diff) <= tolerance
+
+    os.makedirs(output_dir, exist_ok=True)
+    csv_path = compressed_io.with_compression(os.path.join(output_dir, "xxaa_verification.csv"), compression)
+    summary = defaultdict(lambda: {"compared": 0, "missing": 0, "exceeded": 0, "diffs": []})
+    exceeded_drops = defaultdict(int)
+    with profiling.stage("write_csv"):
+        with compressed_io.open_text(csv_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(OUTPUT_FIELDS)
+            for m, (system, drop_time, wmo_file, profile_file, _) in enumerate(messages):
+                for k, level in enumerate(MANDATORY_LEVELS.astype(int).tolist()):
+                    for j, field in enumerate(FIELDS):
+                        if math.isnan(encoded[m, k, j]):
+                            continue
+                        stats = summary[(system, field)]
+                        if math.isnan(raw[m, k, j]):
+                            stats["missing"] += 1
+                            writer.writerow([drop_time, system, os.path.basename(wmo_file),
+                                             os.path.basename(profile_file), level, field,
+                                             encoded[m, k, j], "", "", tolerance[k, j], ""])
+                            continue
+                        stats["compared"] += 1
+                        stats["diffs"].append(diff[m, k, j])
+                        if not within[m, k, j]:
+                            stats["exceeded"] += 1
+                            exceeded_drops[(drop_time, system)] += 1
+                        writer.writerow([drop_time, system, os.path.basename(wmo_file), os.path.basename(profile_file),
+                                         level, field, encoded[m, k, j], round(raw[m, k, j], 3),
+                                         round(diff[m, k, j], 3), tolerance[k, j], int(within[m, k, j])])
+
+    report = format_summary(summary, exceeded_drops, len(messages))
+    summary_path = compressed_io.with_compression(os.path.join(output_dir, "xxaa_verification.txt"), compression)
+    with compressed_io.open_text(summary_path, "w") as f:
+        f.write(report)
+    print(report, end="")
+    print(f"Details written to: {csv_path}")
+    print(f"Summary written to: {summary_path}")
+    return summary
+
+
+def format_summary(summary, exceeded_drops, message_count):
+    lines = [f"=== XXAA mandatory levels vs raw profiles ({message_count} message(s)) ===\n",
+             f"  {'system':<6} {'field':<13} {'compared':>8} {'no profile':>10} {'mean diff':>10} "
+             f"{'max |diff|':>10} {'exceeded':>8}\n"]
+    for system in ("ACS", "AVAPS"):
+        for field in FIELDS:
+            stats = summary.get((system, field))
+            if stats is None:
+                continue
+            diffs = stats["diffs"]
+            mean = math.fsum(diffs) / len(diffs) if diffs else math.nan
+            worst = max((abs(d) for d in diffs), default=math.nan)
+            lines.append(f"  {system:<6} {field:<13} {stats['compared']:>8} {stats['missing']:>10} {mean:>10.3f} "
+                         f"{worst:>10.3f} {stats['exceeded']:>8}\n")
+    if exceeded_drops:
+        lines.append("\nMessages with values outside tolerance of their own profile:\n")
+        for (drop_time, system), count in sorted(exceeded_drops.items()):
+            lines.append(f"  {drop_time}  {system:<5}  {count} value(s)\n")
+    return "".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check the XXAA mandatory levels of each ACS/AVAPS message against the profile it was encoded from.")
+    parser.add_argument("directory", help="Campaign directory (.nc, D files and .WMO messages)")
+    parser.add_argument("--output-dir", default=".", help="Where to write xxaa_verification.csv/.txt (default: .)")
+    parser.add_argument("--max-span", type=float, default=10.0, metavar="HPA",
+                        help="Don't interpolate between profile samples further apart than this (default: 10 hPa)")
+    compressed_io.add_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        print(f"Error: {args.directory} is not a valid directory.")
+        return
+
+    profiling.start_from_args(args, "verify_xxaa")
+    verify_directory(args.directory, args.output_dir, args.compress, args.max_span)
+    profiling.finish_from_args(args)
+
+
+if __name__ == "__main__":
+    main()